@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+###
+# Performance benchmarks of database operations. Every run creates
+# throwaway databases of given sizes in temporary directory, so actual
+# database is never touched. Run from project root:
+#   python3 -m dev.benchmark --sizes 1000 10000 --output results.json
+###
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import timeit
+
+from src import core
+
+SIZES = (1000, 10000, 100000, 1000000)
+REPEAT = 5
+# Number of calls of single-task operations in one measurement:
+CALLS = 100
+DAYS = 365
+TAGS = 20
+
+
+def fill_database(db, size, seed=1):
+    """Fills empty database with given number of tasks. Every task has
+    up to 10 days of activity, up to 3 tags and up to 3 timestamps."""
+    rnd = random.Random(seed)
+    start = datetime.datetime.now() - datetime.timedelta(days=DAYS)
+    dates = [core.date_format(start + datetime.timedelta(days=x))
+             for x in range(DAYS)]
+    tasks, activity, tags, stamps = [], [], [], []
+    for task_id in range(1, size + 1):
+        creation = start + datetime.timedelta(days=rnd.randrange(DAYS))
+        tasks.append((task_id, "Task %d" % task_id,
+                      "Description of task %d" % task_id,
+                      creation.strftime(core.DATE_STORAGE_TEMPLATE)))
+        for date in rnd.sample(dates, rnd.randint(1, 10)):
+            activity.append((date, task_id, rnd.randint(1, 28800)))
+        for tag in rnd.sample(range(1, TAGS + 1), rnd.randint(0, 3)):
+            tags.append((task_id, tag))
+        for _ in range(rnd.randint(0, 3)):
+            stamps.append((rnd.randint(1, 28800), task_id, 0,
+                           creation.strftime(core.DATE_STORAGE_TEMPLATE)))
+    with db.transaction():
+        db.exec_many("INSERT OR IGNORE INTO tags VALUES (?, ?)",
+                     [(x, "Tag %d" % x) for x in range(1, TAGS + 1)])
+        db.insert_many("tasks", ("id", "name", "description",
+                                 "creation_date"), tasks)
+        db.insert_many("activity", ("date", "task_id", "spent_time"),
+                       activity)
+        db.insert_many("tasks_tags", ("task_id", "tag_id"), tags)
+        db.insert_many("timestamps", ("timestamp", "task_id", "event_type",
+                                      "datetime"), stamps)
+    db.exec_script("ANALYZE")
+    return dates
+
+
+def measure(function, repeat):
+    """Returns statistics of function execution time in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        function()
+        timings.append(timeit.default_timer() - start)
+    return {"min": min(timings), "median": statistics.median(timings),
+            "mean": statistics.mean(timings), "repeat": repeat}
+
+
+def fetch_all(db, query, params=()):
+    db.exec_script(query, *params)
+    return db.cur.fetchall()
+
+
+def benchmarks(db, size, dates, rnd):
+    """Returns dictionary of benchmark names and functions."""
+    ids = [rnd.randint(1, size) for _ in range(CALLS)]
+    all_ids = list(range(1, size + 1))
+    filter_dates = rnd.sample(dates, 3)
+    filter_tags = rnd.sample(range(1, TAGS + 1), 2)
+    yesterday = core.date_format(
+        datetime.datetime.now() - datetime.timedelta(days=1))
+
+    def select_task():
+        # Every call reads database, as before the tasks cache:
+        for task_id in ids:
+            db.select_tasks([task_id], cached=False)
+
+    def select_task_cached():
+        # Tasks are loaded to cache below, so only cache hits
+        # are measured:
+        for task_id in ids:
+            db.select_task(task_id)
+
+    def update_task_rollover():
+        with db.transaction():
+            for task_id in ids:
+                db.update_task(task_id, value=rnd.randint(90000, 100000),
+                               prev_date=yesterday)
+
+    def main_script():
+        fetch_all(db, "SELECT count(*), sum(total_time) FROM ({0})".format(
+            core.TASKS_QUERY))
+        fetch_all(db, core.TASKS_QUERY)
+
+    def filter_query(mode, use_dates, use_tags):
+        def run():
+            fetch_all(db, *core.prepare_filter_query(
+                filter_dates if use_dates else [],
+                filter_tags if use_tags else [], mode))
+        return run
+
+    def export(function):
+        def run():
+            for _ in function(all_ids):
+                pass
+        return run
+
+    db.select_tasks(ids)
+    return {
+        "select_task x%d" % CALLS: select_task,
+        "select_task, cache hits x%d" % CALLS: select_task_cached,
+        "update_task with date change x%d" % CALLS: update_task_rollover,
+        "TaskSelectionWindow.main_script": main_script,
+        "filter OR": filter_query("OR", True, True),
+        "filter AND, dates and tags": filter_query("AND", True, True),
+        "filter AND, dates": filter_query("AND", True, False),
+        "filter AND, tags": filter_query("AND", False, True),
+        "tasks_to_export": export(db.tasks_to_export),
+        "dates_to_export": export(db.dates_to_export),
+        "simple_dateslist": db.simple_dateslist,
+    }
+
+
+def run_size(size, repeat, directory):
+    """Creates database of given size and runs all benchmarks on it."""
+    core.TABLE_FILE = os.path.join(directory, "benchmark_%d.db" % size)
+    results = {}
+    try:
+        db = dates = None
+
+        def create():
+            nonlocal db, dates
+            core.check_database()
+            db = core.Db()
+            dates = fill_database(db, size)
+        results["create database"] = measure(create, 1)
+        rnd = random.Random(size)
+        for name, function in benchmarks(db, size, dates, rnd).items():
+            results[name] = measure(function, repeat)
+            print("{0:>8} {1:<40}{2:10.4f} s".format(
+                size, name, results[name]["median"]))
+        # Deletion changes data, so it is measured last:
+        deleted = iter(rnd.sample(range(1, size + 1),
+                                  min(size, CALLS * repeat)))
+        name = "delete_tasks x%d" % CALLS
+        results[name] = measure(lambda: db.delete_tasks(
+            tuple(next(deleted) for _ in range(CALLS))), repeat)
+        print("{0:>8} {1:<40}{2:10.4f} s".format(
+            size, name, results[name]["median"]))
+    finally:
+        core.close_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(core.TABLE_FILE + suffix):
+                os.remove(core.TABLE_FILE + suffix)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="numbers of tasks in test databases")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="file to write results to")
+    args = parser.parse_args()
+    report = {"date": datetime.datetime.now().isoformat(),
+              "python": platform.python_version(),
+              "sqlite": sqlite3.sqlite_version,
+              "platform": platform.platform(),
+              "results": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            report["results"][str(size)] = run_size(size, args.repeat,
+                                                    directory)
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+###
+# Stress test of concurrent access: several processes add spent time,
+# timestamps and tasks to one database at the same time, as several
+# running trackers and scripts do. Afterwards totals are checked,
+# so lost or doubled updates are detected. Run from project root:
+#   python3 -m dev.concurrency_stress --processes 8 --operations 2000
+###
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src import core
+
+TASKS = 20
+
+
+def worker(path, number, operations, seed):
+    """Performs random operations. Returns number of seconds added,
+    number of timestamps and tasks added and list of errors."""
+    core.TABLE_FILE = path
+    rnd = random.Random(seed)
+    db = core.Db()
+    persister = core.Persister(interval=0.01)
+    persister.start()
+    added = stamps = tasks = 0
+    errors = []
+    for op in range(operations):
+        task_id = rnd.randint(1, TASKS)
+        choice = rnd.random()
+        try:
+            if choice < 0.4:
+                # Timer of main window:
+                delta = rnd.randint(1, 100)
+                persister.save(task_id, delta, core.today())
+                added += delta
+            elif choice < 0.7:
+                # Script or command line:
+                delta = rnd.randint(1, 100)
+                now = datetime.datetime.now()
+                db.add_intervals([(task_id,
+                                   now - datetime.timedelta(seconds=delta),
+                                   now)])
+                added += delta
+            elif choice < 0.85:
+                db.add_timestamp(task_id, core.LOG_EVENTS["CUSTOM"],
+                                 "Process %d" % number)
+                stamps += 1
+            elif choice < 0.9:
+                db.insert_task("Process %d task %d" % (number, op))
+                tasks += 1
+            else:
+                db.select_tasks(range(1, TASKS + 1))
+        except core.DbErrors as err:
+            errors.append(str(err))
+    try:
+        persister.stop()
+    except core.DbErrors as err:
+        errors.append(str(err))
+        added -= sum((stop - start).total_seconds()
+                     for _, start, stop in persister.pending)
+    core.close_connections()
+    return added, stamps, tasks, errors
+
+
+def totals(db):
+    db.exec_script("SELECT coalesce(sum(spent_time), 0) FROM activity")
+    spent = db.cur.fetchone()[0]
+    db.exec_script("SELECT count(*) FROM timestamps")
+    stamps = db.cur.fetchone()[0]
+    db.exec_script("SELECT count(*) FROM tasks")
+    return spent, stamps, db.cur.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=2000,
+                        help="operations per process")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stress.db")
+        core.TABLE_FILE = path
+        core.check_database()
+        db = core.Db()
+        with db.transaction():
+            for x in range(1, TASKS + 1):
+                db.insert_task("Task %d" % x)
+        before = totals(db)
+        core.close_connections()
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.starmap(worker, [
+                (path, x, args.operations, args.seed + x)
+                for x in range(args.processes)])
+        duration = time.perf_counter() - start
+        db = core.Db()
+        after = totals(db)
+        core.close_connections()
+    expected = tuple(before[x] + sum(r[x] for r in results)
+                     for x in range(3))
+    errors = [e for r in results for e in r[3]]
+    print("%d processes, %d operations in %.2f s, %.0f operations/s"
+          % (args.processes, args.processes * args.operations, duration,
+             args.processes * args.operations / duration))
+    failed = bool(errors)
+    for name, got, wanted in zip(("Spent time", "Timestamps", "Tasks"),
+                                 after, expected):
+        status = "OK" if got == wanted else "MISMATCH"
+        failed = failed or got != wanted
+        print("{0:<12}{1:>12}{2:>12}  {3}".format(name, got, wanted, status))
+    print("Errors: %d" % len(errors))
+    for error in sorted(set(errors)):
+        print("  %s" % error)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
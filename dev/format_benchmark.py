@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+###
+# Compares time and date formatters with their previous versions
+# on 1M values. Run from project root:
+#   python3 -m dev.format_benchmark
+# Measured speedup: unique durations about 1.4x for single calls
+# and 1.7x for whole columns, repeated durations 6-9x, stored dates
+# about 12-15x. Unique durations gain the least, as they are not
+# served from cache.
+###
+
+import datetime
+import random
+import time
+import timeit
+
+from src import core
+
+VALUES_COUNT = 1000000
+
+
+def old_time_format(sec):
+    days = int(sec // 86400)
+    time_ = time.strftime("%H:%M:%S", time.gmtime(sec % 86400))
+    prefix = "%d days, " % days
+    if days == 0:
+        prefix = ''
+    elif str(days).endswith("1"):
+        if days != 11:
+            prefix = "{} day, ".format(days)
+    return "{}{}".format(prefix, time_)
+
+
+def old_table_date_format(string,
+                          template=core.DATE_FULL_HUMAN_READABLE_TEMPLATE):
+    return core.date_format(
+        core.str_to_date(string, core.DATE_STORAGE_TEMPLATE), template)
+
+
+def measure(name, function, values):
+    start = timeit.default_timer()
+    function(values)
+    duration = timeit.default_timer() - start
+    print("{0:<45}{1:8.3f} s".format(name, duration))
+    return duration
+
+
+def clear_caches():
+    core._cached_seconds_format.cache_clear()
+    core.table_date_format.cache_clear()
+
+
+random.seed(1)
+# Spent time of tasks: mostly unique values:
+seconds = [random.randint(0, 400 * 86400) for _ in range(VALUES_COUNT)]
+# Timer ticks: the same values are formatted many times:
+ticks = [random.randint(0, 3600) for _ in range(VALUES_COUNT)]
+start_date = datetime.datetime(2015, 1, 1)
+dates = [(start_date + datetime.timedelta(
+    seconds=random.randint(0, 10 * 365 * 86400),
+    microseconds=random.randint(0, 999999))).strftime(
+    core.DATE_STORAGE_TEMPLATE) for _ in range(VALUES_COUNT)]
+
+for title, values in (("unique durations", seconds),
+                      ("repeated durations", ticks)):
+    clear_caches()
+    old = measure("time_format, old, " + title,
+                  lambda v: [old_time_format(x) for x in v], values)
+    new = measure("time_format, " + title,
+                  lambda v: [core.time_format(x) for x in v], values)
+    clear_caches()
+    column = measure("time_format_column, " + title,
+                     core.time_format_column, values)
+    print("Speedup: {0:.1f}x, column: {1:.1f}x\n".format(old / new,
+                                                        old / column))
+
+clear_caches()
+old = measure("table_date_format, old",
+              lambda v: [old_table_date_format(x) for x in v], dates)
+clear_caches()
+new = measure("table_date_format_column",
+              core.table_date_format_column, dates)
+print("Speedup: {0:.1f}x".format(old / new))
@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 
 ###
-# !!!WARNING!!!
-# This file is for testing purposes only! It will create a lot of
-# random generated tasks in your actual database! So don't use it
-# on production database!
+# Creates new database filled with random generated tasks, tags,
+# activity and timestamps. Run from project root:
+#   python3 -m dev.task_generator test.db --years 5 --tasks-per-day 500 800
+# Existing files are not touched.
 ###
 
+import argparse
+import datetime
+import os
 import random
+import sys
+
 from src import core
 
-TASK_LIMIT = 50
+# Number of rows inserted by one executemany() call:
+CHUNK = 50000
+# Tasks are continued from this number of most recently created ones:
+ACTIVE_TASKS = 500
 
 SYMBOLS = []
 for i in range(65, 91):     # latin uppercase
@@ -19,21 +27,147 @@ for i in range(97, 122):    # latin lowercase
     SYMBOLS.append(chr(i))
 
 
-def randword(min_l=6, max_l=20, count=1, table=SYMBOLS):
-    random.seed()
+def randword(rnd, min_l=6, max_l=20, count=1, table=SYMBOLS):
     phrase = []
     for w in range(count):
-        word = [random.choice(table) for x in range(random.randint(min_l, max_l))]
+        word = [rnd.choice(table) for x in range(rnd.randint(min_l, max_l))]
         phrase.append("".join(word))
     return " ".join(phrase)
 
 
-core.check_database()
-db = core.Db()
-for task in range(TASK_LIMIT):
-    mi, ma, c = random.randint(5, 10), random.randint(11, 21), random.randint(1, 4)
-    taskname = randword(mi, ma, c) + str(task)
-    task_id = db.insert_task(taskname)
-    db.update_task(task_id, field="description", value=taskname)
-    db.update_task(task_id, value=random.randint(145, 9800))
-    print("Task %d added" % task)
\ No newline at end of file
+def description(rnd, size):
+    """Returns random text of given length or None for empty one."""
+    if not size:
+        return None
+    words = []
+    length = 0
+    while length < size:
+        words.append(randword(rnd, 2, 10))
+        length += len(words[-1]) + 1
+    return " ".join(words)[:size]
+
+
+class Inserter:
+    """Collects rows and inserts them by chunks."""
+
+    def __init__(self, db, table, fields):
+        self.db = db
+        self.table = table
+        self.fields = fields
+        self.rows = []
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= CHUNK:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.db.insert_many(self.table, self.fields, self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+
+def generate(db, args):
+    """Fills database day by day, starting from args.years ago."""
+    rnd = random.Random(args.seed)
+    tasks = Inserter(db, "tasks", ("id", "name", "description",
+                                   "creation_date"))
+    activity = Inserter(db, "activity", ("date", "task_id", "spent_time"))
+    tags = Inserter(db, "tasks_tags", ("task_id", "tag_id"))
+    stamps = Inserter(db, "timestamps", ("timestamp", "task_id",
+                                         "event_type", "datetime", "comment"))
+    db.exec_many("INSERT OR IGNORE INTO tags (id, name) VALUES (?, ?)",
+                 [(x, randword(rnd, 3, 12) + str(x))
+                  for x in range(2, args.tags + 1)])
+    # Total time of every task, needed for timestamps:
+    totals = {}
+    recent = []
+    today = datetime.datetime.now().replace(hour=0, minute=0, second=0,
+                                            microsecond=0)
+    day = today - datetime.timedelta(days=round(args.years * 365))
+    while day <= today:
+        date = core.date_format(day)
+        day_tasks = set()
+        for _ in range(rnd.randint(*args.tasks_per_day)):
+            if recent and rnd.random() >= args.new_tasks:
+                day_tasks.add(rnd.choice(recent))
+                continue
+            task_id = len(totals) + 1
+            totals[task_id] = 0
+            recent.append(task_id)
+            if len(recent) > ACTIVE_TASKS:
+                recent.pop(0)
+            creation = day + datetime.timedelta(seconds=rnd.randrange(86400))
+            tasks.add((task_id,
+                       randword(rnd, 5, 12, rnd.randint(1, 4)) + str(task_id),
+                       description(rnd, rnd.randint(*args.description_size)),
+                       creation.strftime(core.DATE_STORAGE_TEMPLATE)))
+            for tag in rnd.sample(range(1, args.tags + 1),
+                                  min(args.tags,
+                                      rnd.randint(*args.tags_per_task))):
+                tags.add((task_id, tag))
+            day_tasks.add(task_id)
+        for task_id in day_tasks:
+            spent = rnd.randint(1, args.max_time)
+            for _ in range(rnd.randint(*args.timestamps_per_task)):
+                stamp = totals[task_id] + rnd.randint(0, spent)
+                moment = day + datetime.timedelta(
+                    seconds=rnd.randrange(86400))
+                stamps.add((stamp, task_id,
+                            rnd.choice(tuple(core.LOG_EVENTS.values())),
+                            moment.strftime(core.DATE_STORAGE_TEMPLATE),
+                            None))
+            totals[task_id] += spent
+            activity.add((date, task_id, spent))
+        day += datetime.timedelta(days=1)
+    for inserter in (tasks, activity, tags, stamps):
+        inserter.flush()
+    return tasks.count, activity.count, tags.count, stamps.count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Creates database filled with random data.")
+    parser.add_argument("path", help="new database file")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed for reproducible data")
+    parser.add_argument("--years", type=float, default=3,
+                        help="period of activity")
+    parser.add_argument("--tasks-per-day", type=int, nargs=2, default=(3, 15),
+                        metavar=("MIN", "MAX"))
+    parser.add_argument("--new-tasks", type=float, default=0.2,
+                        help="probability that task worked on is a new one")
+    parser.add_argument("--tags", type=int, default=30,
+                        help="number of tags")
+    parser.add_argument("--tags-per-task", type=int, nargs=2, default=(0, 3),
+                        metavar=("MIN", "MAX"))
+    parser.add_argument("--timestamps-per-task", type=int, nargs=2,
+                        default=(0, 2), metavar=("MIN", "MAX"),
+                        help="timestamps per task per day")
+    parser.add_argument("--description-size", type=int, nargs=2,
+                        default=(0, 300), metavar=("MIN", "MAX"),
+                        help="description length in characters")
+    parser.add_argument("--max-time", type=int, default=28800,
+                        help="maximum time spent on task per day, seconds")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if os.path.exists(args.path):
+        sys.exit("File %s already exists." % args.path)
+    core.TABLE_FILE = args.path
+    core.check_database()
+    db = core.Db()
+    with db.transaction():
+        counts = generate(db, args)
+    db.exec_script("ANALYZE")
+    core.close_connections()
+    print("Created: %d tasks, %d activity records, %d task tags, "
+          "%d timestamps." % counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""Command line interface of the time tracker. Works without GUI:
+    cli.py start "Task name"
+    cli.py status
+    cli.py stop
+    cli.py report --from 2024-01-01 --to 2024-01-31
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+import core
+
+
+def find_task(db, task, create=False):
+    """Returns id of task given by its id or name.
+    Task is created if it does not exist and create is True."""
+    if task.isdigit() and db.select_tasks([int(task)]):
+        return int(task)
+    db.exec_script("SELECT id FROM tasks WHERE name=?", task)
+    row = db.cur.fetchone()
+    if row:
+        return row[0]
+    if create:
+        return db.insert_task(task)
+    raise core.DbErrors("Task not found: %s" % task)
+
+
+def start(db, args):
+    task_id = find_task(db, args.task, args.create)
+    db.start_timer(task_id)
+    print("Started: %s" % db.select_task(task_id)["name"])
+
+
+def stop(db, args):
+    if args.task:
+        ids = [find_task(db, args.task)]
+    else:
+        ids = list(db.running_timers())
+    for task_id in ids:
+        spent = db.stop_timer(task_id)
+        print("Stopped: {0}, {1}".format(db.select_task(task_id)["name"],
+                                         core.time_format(spent)))
+
+
+def status(db, args):
+    timers = db.running_timers()
+    if not timers:
+        print("No running tasks.")
+        return
+    tasks = db.select_tasks(timers)
+    now = datetime.datetime.now()
+    for task_id, started in timers.items():
+        spent = (now - started).total_seconds()
+        print("{0}\t{1}\trunning {2}\ttotal {3}".format(
+            task_id, tasks[task_id]["name"], core.time_format(spent),
+            core.time_format(tasks[task_id]["spent_total"] + spent)))
+
+
+def timestamp(db, args):
+    task_id = find_task(db, args.task)
+    running = db.running_timers()
+    spent_total = db.select_task(task_id)["spent_total"]
+    if task_id in running:
+        spent_total += (datetime.datetime.now()
+                        - running[task_id]).total_seconds()
+    db.add_timestamp(task_id, core.LOG_EVENTS["CUSTOM"], args.comment,
+                     spent_total)
+    print("Timestamp added.")
+
+
+def report(db, args):
+    db.exec_script("SELECT name, sum(spent_time) FROM activity "
+                   "JOIN tasks ON tasks.id=activity.task_id "
+                   "WHERE date BETWEEN ? AND ? GROUP BY tasks.id "
+                   "ORDER BY name", args.date_from, args.date_to)
+    total = 0
+    for name, spent in db.cur.fetchall():
+        total += spent
+        print("{0}\t{1}".format(name, core.time_format(spent)))
+    print("Total\t%s" % core.time_format(total))
+
+
+def export_tasks(db, args):
+    # Export machinery is needed only by this command:
+    import export
+    if args.format not in export.WRITERS:
+        sys.exit("Unknown format. Available formats: "
+                 + "; ".join(export.WRITERS))
+    db.exec_script("SELECT DISTINCT task_id FROM activity "
+                   "WHERE date BETWEEN ? AND ?", args.date_from, args.date_to)
+    ids = [x[0] for x in db.cur.fetchall()]
+    export.export_tasks(ids, args.file, args.format)
+    print("Exported %d tasks." % len(ids))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time tracker.")
+    parser.add_argument("--db", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), core.TABLE_FILE),
+        help="database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("start", help="start task timer")
+    command.add_argument("task", help="task id or name")
+    command.add_argument("--create", action="store_true",
+                         help="create task if it does not exist")
+    command.set_defaults(function=start)
+    command = commands.add_parser("stop", help="stop task timer")
+    command.add_argument("task", nargs="?",
+                         help="task id or name, all tasks by default")
+    command.set_defaults(function=stop)
+    command = commands.add_parser("status", help="show running tasks")
+    command.set_defaults(function=status)
+    command = commands.add_parser("timestamp", help="add timestamp")
+    command.add_argument("task", help="task id or name")
+    command.add_argument("comment", nargs="?", default="")
+    command.set_defaults(function=timestamp)
+    for name, function, help_text in (
+            ("report", report, "show time spent on tasks"),
+            ("export", export_tasks, "export tasks worked on")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--from", dest="date_from", default=core.today(),
+                             help="first date, YYYY-MM-DD, today by default")
+        command.add_argument("--to", dest="date_to", default=core.today(),
+                             help="last date, YYYY-MM-DD, today by default")
+        command.set_defaults(function=function)
+    command.add_argument("file")
+    command.add_argument("--format", default="CSV, task-based",
+                         help="export format")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    core.TABLE_FILE = args.db
+    try:
+        core.check_database()
+        args.function(core.Db(), args)
+    except core.DbErrors as err:
+        sys.exit(str(err))
+    finally:
+        core.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
 
 from collections import OrderedDict, namedtuple
+from contextlib import contextmanager, nullcontext
+import copy
+import csv
 import datetime
+import functools
+import io
+import json
 import os
+import queue
+import re
 import sqlite3
+import threading
 import time
 
 
@@ -17,37 +26,260 @@ class DbErrors(Exception):
     pass
 
 
+class ConnectionPool:
+    """Process-wide set of connections to one database file:
+    one long-lived write connection and several read connections.
+    Every connection is configured only once, when it is created."""
+
+    def __init__(self, filename, readers_count=None):
+        self.filename = filename
+        self.readers_count = readers_count or READ_POOL_SIZE
+        # Guards write connection when it is used from several threads:
+        self.write_lock = threading.RLock()
+        # Nesting level of Db.transaction() blocks on write connection:
+        self.transaction_depth = 0
+        # Tasks changed inside of transaction, their cached data
+        # is dropped once more after commit. None means all tasks:
+        self.changed_tasks = set()
+        # Last seen PRAGMA data_version values, by connection:
+        self.data_versions = {}
+        # Number of commits of changes made by write connection:
+        self.write_count = 0
+        # Functions called when outermost transaction() block ends,
+        # with True if it is committed and False if it is rolled back:
+        self.transaction_callbacks = []
+        self._lock = threading.Lock()
+        self._writer = None
+        self._readers = []
+        self._idle_readers = queue.LifoQueue()
+
+    def _connect(self, readonly=False):
+        # Timeout makes SQLite wait for locks held by other processes:
+        con = sqlite3.connect(self.filename, timeout=BUSY_TIMEOUT,
+                              check_same_thread=False)
+        if not readonly:
+            con.execute("PRAGMA journal_mode=WAL;")
+        for pragma in CONNECTION_PRAGMAS:
+            con.execute(pragma)
+        if readonly:
+            con.execute("PRAGMA query_only=ON;")
+        return con
+
+    def writer(self):
+        """Returns shared write connection."""
+        with self._lock:
+            if not self._writer:
+                self._writer = self._connect()
+            return self._writer
+
+    def acquire_reader(self):
+        """Takes read connection from the pool. Waits for a free one
+        if all connections are in use."""
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if len(self._readers) < self.readers_count:
+                    con = self._connect(readonly=True)
+                    self._readers.append(con)
+                    return con
+            return self._idle_readers.get()
+
+    def data_changed(self, con):
+        """Checks if database has been changed by other connections,
+        including other processes, since previous call for the same
+        connection. Changes made by connection itself are not seen."""
+        version = con.execute("PRAGMA data_version").fetchone()[0]
+        with self._lock:
+            changed = self.data_versions.get(con) != version
+            self.data_versions[con] = version
+        return changed
+
+    def release_reader(self, con):
+        """Returns read connection to the pool."""
+        self._idle_readers.put(con)
+
+    def close(self):
+        """Closes all connections of the pool."""
+        with self._lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+            for con in self._readers:
+                con.close()
+            self._readers = []
+            self._idle_readers = queue.LifoQueue()
+            self.data_versions = {}
+
+
+def connection_pool(filename=None):
+    """Returns connection pool for given database file.
+    Pool is created on first request."""
+    filename = filename or TABLE_FILE
+    with _POOLS_LOCK:
+        if filename not in _POOLS:
+            _POOLS[filename] = ConnectionPool(filename)
+        return _POOLS[filename]
+
+
+def close_connections():
+    """Closes all database connections. Should be called on exit."""
+    stop_persister()
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
+
+
 class Db:
-    """Class for interaction with database."""
+    """Class for interaction with database.
+    Uses connections from the shared pool, so creating an instance
+    is cheap. Read-only instance should be closed to return
+    its connection to the pool."""
 
-    def __init__(self):
+    def __init__(self, readonly=False):
         self.db_filename = TABLE_FILE
+        self.readonly = readonly
+        # Cursors returned by open_cursor() which are not closed yet:
+        self.cursors = set()
         self.connect()
 
     def connect(self):
-        """Connection to database."""
-        self.con = sqlite3.connect(self.db_filename)
+        """Take connection to database from the pool."""
+        self.pool = connection_pool(self.db_filename)
+        if self.readonly:
+            self.con = self.pool.acquire_reader()
+        else:
+            self.con = self.pool.writer()
         self.cur = self.con.cursor()
 
+    def close(self):
+        """Release connection. Shared write connection stays open."""
+        for cursor in list(self.cursors):
+            self.close_cursor(cursor)
+        self.cur.close()
+        if self.readonly and self.con:
+            self.pool.release_reader(self.con)
+            self.con = None
+
     def reconnect(self):
-        """Used to reconnect after exception."""
+        """Used to restore connection state after exception.
+        Connection is not rolled back: it is shared with other threads
+        and transaction() already rolls back its own failed statements."""
         self.cur.close()
-        self.con.close()
-        self.connect()
+        self.cur = self.con.cursor()
+
+    def _lock(self):
+        """Write connection is shared, so it is locked for every statement.
+        Read connections belong to only one Db instance."""
+        return nullcontext() if self.readonly else self.pool.write_lock
+
+    def _commit(self):
+        """Commit unless inside of a transaction() block."""
+        if self.readonly or not self.pool.transaction_depth:
+            changed = not self.readonly and self.con.in_transaction
+            self.con.commit()
+            if changed:
+                self.pool.write_count += 1
+
+    @contextmanager
+    def transaction(self):
+        """Context manager which groups all statements executed inside it
+        into one commit. Rolls back everything on exception.
+        Nested blocks are joined to the outer one."""
+        with self.pool.write_lock:
+            self.pool.transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.pool.transaction_depth -= 1
+                if not self.pool.transaction_depth:
+                    self.con.rollback()
+                    self._end_transaction(False)
+                raise
+            else:
+                self.pool.transaction_depth -= 1
+                if not self.pool.transaction_depth:
+                    changed = self.con.in_transaction
+                    try:
+                        self.con.commit()
+                    except sqlite3.DatabaseError as err:
+                        self.con.rollback()
+                        self._end_transaction(False)
+                        raise DbErrors(err)
+                    if changed:
+                        self.pool.write_count += 1
+                    self._end_transaction(True)
+
+    def _end_transaction(self, committed):
+        TASK_CACHE.invalidate(self.pool.changed_tasks)
+        self.pool.changed_tasks = set()
+        callbacks = self.pool.transaction_callbacks
+        self.pool.transaction_callbacks = []
+        for callback in callbacks:
+            callback(committed)
+
+    def after_transaction(self, callback):
+        """Calls callback(committed) when outermost transaction() block
+        ends, or at once with True outside of transaction."""
+        with self.pool.write_lock:
+            if self.pool.transaction_depth:
+                self.pool.transaction_callbacks.append(callback)
+                return
+        callback(True)
+
+    def invalidate_tasks(self, ids=None):
+        """Drops cached data of given tasks, or of all tasks if ids
+        is None. Inside of transaction it is done once more after commit,
+        so data read before commit is not kept."""
+        TASK_CACHE.invalidate(ids)
+        if self.pool.transaction_depth:
+            if ids is None or self.pool.changed_tasks is None:
+                self.pool.changed_tasks = None
+            else:
+                self.pool.changed_tasks.update(ids)
+
+    def _retry(self, function, *args):
+        """Calls function, repeating the call with growing delays while
+        database is locked by another process. Statement is repeated
+        only outside of transaction() block: inside of it the whole
+        block has to be repeated."""
+        delay = RETRY_DELAY
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                return function(*args)
+            except sqlite3.OperationalError as err:
+                if (attempt == RETRY_ATTEMPTS - 1 or not is_busy(err)
+                        or (not self.readonly
+                            and self.pool.transaction_depth)):
+                    raise
+                time.sleep(delay)
+                delay *= 2
 
     def exec_script(self, script, *values):
         """Custom script execution and commit. Returns lastrowid.
         Raises DbErrors on database exceptions."""
-        try:
-            if not values:
-                self.cur.execute(script)
+        with self._lock():
+            try:
+                self._retry(self.cur.execute, script, values)
+                self._retry(self._commit)
+            except sqlite3.DatabaseError as err:
+                raise DbErrors(err)
             else:
-                self.cur.execute(script, values)
-        except sqlite3.DatabaseError as err:
-            raise DbErrors(err)
-        else:
-            self.con.commit()
-            return self.cur.lastrowid
+                return self.cur.lastrowid
+
+    def exec_many(self, script, rows):
+        """Executes script for every tuple of values in rows
+        and commits once. Raises DbErrors on database exceptions."""
+        if not isinstance(rows, (list, tuple)):
+            # Rows may be needed again if execution is repeated:
+            rows = list(rows)
+        with self._lock():
+            try:
+                self._retry(self.cur.executemany, script, rows)
+                self._retry(self._commit)
+            except sqlite3.DatabaseError as err:
+                raise DbErrors(err)
 
     def find_by_clause(self, table, field, value, searchfield, order=None):
         """Returns "searchfield" for field=value."""
@@ -71,22 +303,44 @@ class Db:
 
     def select_task(self, task_id):
         """Returns dictionary of values for given task_id."""
-        res = self.find_by_clause(searchfield='*', field='id', value=task_id,
-                                table='tasks')[0]
-        task = {key: res[number] for number, key
-                in enumerate(["id", "name", "descr", "creation_date"])}
-        # Adding full spent time:
-        self.exec_script(
-            'SELECT sum(spent_time) FROM activity WHERE task_id=%s' % task_id)
-        # Adding spent time on position 3:
-        task["spent_total"] = self.cur.fetchone()[0]
-        # Append today's spent time:
-        self.exec_script(
-            'SELECT spent_time FROM activity WHERE task_id={0} AND '
-            'date="{1}"'.format(task_id, date_format(datetime.datetime.now())))
-        today_time = self.cur.fetchone()
-        task["spent_today"] = today_time[0] if today_time else 0
-        return task
+        return self.select_tasks([task_id])[task_id]
+
+    def select_tasks(self, ids, cached=True):
+        """Returns dictionary of task dictionaries for given task ids.
+        Tasks which are not cached are loaded by one query. Tasks which
+        do not exist are absent in result. Cache is dropped if database
+        has been changed by another process. Cache is not used if cached
+        is False."""
+        ids = list(ids)
+        date = today()
+        if cached:
+            with self._lock():
+                if self.pool.data_changed(self.con):
+                    TASK_CACHE.invalidate()
+            tasks, missing, generation = TASK_CACHE.get(ids, date)
+        else:
+            tasks, missing, generation = {}, ids, None
+        if missing:
+            self.exec_script(
+                "SELECT tasks.id, name, description, creation_date, "
+                "coalesce(total_time, 0), coalesce(spent_time, 0) FROM tasks "
+                "LEFT JOIN task_totals ON task_totals.task_id=tasks.id "
+                "LEFT JOIN activity ON activity.task_id=tasks.id "
+                "AND activity.date=? WHERE tasks.id IN "
+                "(SELECT value FROM json_each(?))", date, json.dumps(missing))
+            loaded = {row[0]: dict(zip(("id", "name", "descr",
+                                        "creation_date", "spent_total",
+                                        "spent_today"), row))
+                      for row in self.cur.fetchall()}
+            if cached:
+                TASK_CACHE.put(loaded, date, generation)
+            tasks.update(loaded)
+        return {x: tasks[x] for x in ids if x in tasks}
+
+    def options(self):
+        """Returns dictionary of all program options."""
+        self.exec_script("SELECT name, value FROM options")
+        return dict(self.cur.fetchall())
 
     def insert(self, table, fields, values):
         """Insert into fields given values.
@@ -96,18 +350,29 @@ class Db:
             'INSERT INTO {0} {1} VALUES {2}'.format(table, fields,
                                                     placeholder), *values)
 
+    def insert_many(self, table, fields, rows):
+        """Insert several rows using one statement.
+        Fields should be tuple, rows - iterable of tuples of same length."""
+        placeholder = "(" + ",".join(["?"] * len(fields)) + ")"
+        self.exec_many(
+            'INSERT INTO {0} ({1}) VALUES {2}'.format(table, ",".join(fields),
+                                                     placeholder), rows)
+        if table in CACHED_TABLES:
+            self.invalidate_tasks()
+
     def insert_task(self, name):
         """Insert task into database."""
         try:
-            rowid = self.insert('tasks', ('name', 'creation_date'),
-                                (name, date_format(datetime.datetime.now(),
-                                                   DATE_STORAGE_TEMPLATE)))
+            with self.transaction():
+                task_id = self.insert('tasks', ('name', 'creation_date'),
+                                      (name, date_format(
+                                          datetime.datetime.now(),
+                                          DATE_STORAGE_TEMPLATE)))
+                self.insert_task_activity(task_id, 0)
+                self.insert("tasks_tags", ("tag_id", "task_id"), (1, task_id))
         except sqlite3.IntegrityError:
             raise DbErrors("Task name already exists")
         else:
-            task_id = self.find_by_clause("tasks", "rowid", rowid, "id")[0][0]
-            self.insert_task_activity(task_id, 0)
-            self.insert("tasks_tags", ("tag_id", "task_id"), (1, task_id))
             return task_id
 
     def update(self, field_id, field, value, table="tasks", updfield="id"):
@@ -117,6 +382,9 @@ class Db:
             "UPDATE {0} SET {1}=? WHERE {3}='{2}'".format(table, field,
                                                           field_id, updfield),
             value)
+        if table in CACHED_TABLES:
+            self.invalidate_tasks(
+                [field_id] if table == "tasks" and updfield == "id" else None)
 
     def check_task_activity_exists(self, task_id, date):
         """Returns rowid of row with task activity for provided date
@@ -132,36 +400,71 @@ class Db:
         """Updates some fields for given task id."""
         res = None
         if field == 'spent_time':
-            now = datetime.datetime.now()
-            current_date = today()
-            daterow = self.check_task_activity_exists(task_id, prev_date)
-            if current_date == prev_date:
-                if daterow:
-                    self.update(daterow, table='activity', updfield='rowid',
-                                field=field, value=value)
-                else:
-                    self.insert_task_activity(task_id, value, prev_date)
-            else:
-                today_secs = datetime.timedelta(
-                    hours=now.hour, minutes=now.minute,
-                    seconds=now.second).total_seconds()
-                if daterow:
-                    self.update(daterow, table='activity', updfield='rowid',
-                                field=field, value=value - today_secs)
-                else:
-                    self.insert_task_activity(task_id, value - today_secs,
-                                              prev_date)
-                self.insert_task_activity(task_id, today_secs, current_date)
-                res = namedtuple("res", "remained,current_date")(today_secs, current_date)
+            rows, res = split_spent_time(value, prev_date)
+            with self.transaction():
+                for date, spent_time in rows:
+                    self.set_task_activity(task_id, spent_time, date)
         else:
             self.update(task_id, field=field, value=value)
         return res
 
+    def add_intervals(self, intervals):
+        """Records (task_id, start, stop) intervals of work, start and
+        stop are datetimes. Their time is added to activity at once."""
+        def storage_format(moment):
+            # SQLite date functions have millisecond precision:
+            return date_format(moment.replace(
+                microsecond=moment.microsecond // 1000 * 1000),
+                DATE_STORAGE_TEMPLATE)
+        with self.transaction():
+            self.exec_many(
+                "INSERT INTO intervals (task_id, start, stop) "
+                "VALUES (?, ?, ?)",
+                [(task_id, storage_format(start), storage_format(stop))
+                 for task_id, start, stop in intervals])
+            self.compact_intervals()
+
+    def compact_intervals(self):
+        """Adds time of intervals which have not been compacted yet
+        to activity, split by days, in one transaction. Intervals
+        themselves are kept."""
+        with self.transaction():
+            # Writing statement goes first, so the transaction sees
+            # intervals added by other processes up to this moment:
+            self.exec_script(COMPACT_INTERVALS)
+            self.exec_script("SELECT DISTINCT task_id FROM intervals "
+                             "WHERE id > (SELECT last_id "
+                             "FROM intervals_compacted)")
+            self.invalidate_tasks([x[0] for x in self.cur.fetchall()])
+            self.exec_script("UPDATE intervals_compacted SET last_id="
+                             "(SELECT coalesce(max(id), 0) FROM intervals)")
+
+    def add_task_activity(self, task_id, spent_time, date):
+        """Adds spent time to task activity for provided date. Unlike
+        set_task_activity(), changes made by other processes are kept."""
+        self.exec_script(
+            "INSERT INTO activity (date, task_id, spent_time) VALUES (?, ?, ?) "
+            "ON CONFLICT (task_id, date) "
+            "DO UPDATE SET spent_time=spent_time+excluded.spent_time",
+            date, task_id, spent_time)
+        self.invalidate_tasks([task_id])
+
+    def set_task_activity(self, task_id, spent_time, date):
+        """Sets task spent time for provided date, creating activity row
+        if it does not exist yet. Relies on unique (task_id, date) index."""
+        self.exec_script(
+            "INSERT INTO activity (date, task_id, spent_time) VALUES (?, ?, ?) "
+            "ON CONFLICT (task_id, date) "
+            "DO UPDATE SET spent_time=excluded.spent_time",
+            date, task_id, spent_time)
+        self.invalidate_tasks([task_id])
+
     def insert_task_activity(self, task_id, spent_time, date=None):
         self.insert("activity", ("date", "task_id", "spent_time"),
                     (date if date else date_format(datetime.datetime.now()),
                      task_id,
                      spent_time))
+        self.invalidate_tasks([task_id])
 
     def update_preserved_tasks(self, tasks):
         if type(tasks) is not str:
@@ -186,109 +489,117 @@ class Db:
         if len(clauses) > 0:
             clauses = " WHERE " + clauses
         self.exec_script("DELETE FROM {0}{1}".format(table, clauses))
+        if table in CACHED_TABLES:
+            self.invalidate_tasks()
+
+    def delete_many(self, table, fields, rows):
+        """Removes records matching every tuple of values in rows.
+        Fields should be tuple of same length as rows items:
+        delete_many("timestamps", ("task_id", "datetime"),
+                    [(1, date1), (1, date2)])
+        """
+        clauses = " AND ".join("{0}=?".format(field) for field in fields)
+        self.exec_many("DELETE FROM {0} WHERE {1}".format(table, clauses),
+                       rows)
+        if table in CACHED_TABLES:
+            self.invalidate_tasks()
 
     def delete_tasks(self, values):
         """Removes task and all corresponding records. Values has to be tuple.
         """
-        self.delete(id=values)
-        self.delete(task_id=values, table="activity")
-        self.delete(task_id=values, table="timestamps")
-        self.delete(task_id=values, table="tasks_tags")
+        with self.transaction():
+            self.delete(id=values)
+            self.delete(task_id=values, table="activity")
+            self.delete(task_id=values, table="timestamps")
+            self.delete(task_id=values, table="tasks_tags")
+            self.delete(task_id=values, table="intervals")
+            self.delete(task_id=values, table="running_tasks")
+
+    def open_cursor(self, script, *values):
+        """Executes script on a new cursor and returns it. Rows are read
+        by the caller, which should close the cursor by close_cursor()."""
+        cursor = self.con.cursor()
+        with self._lock():
+            try:
+                cursor.execute(script, values)
+            except sqlite3.DatabaseError as err:
+                cursor.close()
+                raise DbErrors(err)
+        self.cursors.add(cursor)
+        return cursor
+
+    def close_cursor(self, cursor):
+        """Closes cursor returned by open_cursor()."""
+        cursor.close()
+        self.cursors.discard(cursor)
+
+    def fetch_batches(self, script, *values):
+        """Executes script and yields its result rows, fetching them
+        from database by batches."""
+        cursor = self.open_cursor(script, *values)
+        try:
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            self.close_cursor(cursor)
 
     def tasks_to_export(self, ids):
-        """Prepare tasks list for export."""
-        self.exec_script(
-            "select name, description, activity.date, activity.spent_time "
-            "from tasks join activity "
-            "on tasks.id=activity.task_id where tasks.id in ({0}) "
-            "order by tasks.name, activity.date".
-            format(",".join(map(str, ids))))
-        db_response = [{"name": item[0], "descr": item[1] if item[1] else '',
-                        "date": item[2], "spent_time": item[3]}
-                       for item in self.cur.fetchall()]
-        prepared_data = OrderedDict()
-        for item in db_response:
-            if item["name"] in prepared_data:
-                prepared_data[item["name"]]["dates"].append(
-                    (item["date"], time_format(item["spent_time"])))
+        """Yields rows of task-based export table. Rows are grouped
+        by task while being read from database. Fractions of seconds
+        are dropped by time_format(), as in tasks table."""
+        yield ('Task', 'Description', 'Dates', 'Time', 'Total working time')
+        current = None
+        for name, descr, date, spent, total in self.fetch_batches(
+                "SELECT name, description, activity.date, activity.spent_time,"
+                " task_totals.total_time FROM tasks JOIN activity "
+                "ON tasks.id=activity.task_id JOIN task_totals "
+                "ON tasks.id=task_totals.task_id WHERE tasks.id IN "
+                "(SELECT value FROM json_each(?)) "
+                "ORDER BY tasks.name, activity.date", json.dumps(list(ids))):
+            if name != current:
+                current = name
+                yield (name, descr or '', date, time_format(spent),
+                       time_format(total))
             else:
-                prepared_data[item["name"]] = {
-                    "descr": item['descr'],
-                    "dates": [(item["date"],
-                              time_format(item["spent_time"]))]}
-        self.exec_script(
-            "select name, fulltime from tasks join (select task_id, "
-            "sum(spent_time) as fulltime "
-            "from activity where task_id in ({0}) group by task_id) "
-            "as act on tasks.id=act.task_id".
-            format(",".join(map(str, ids))))
-        for item in self.cur.fetchall():
-            prepared_data[item[0]]["spent_total"] = time_format(item[1])
-
-        result = ['Task,Description,Dates,Time,Total working time']
-        for key in prepared_data:
-            temp_list = [key, prepared_data[key]["descr"],
-                         prepared_data[key]["dates"][0][0],
-                         prepared_data[key]["dates"][0][1],
-                         prepared_data[key]["spent_total"]]
-            result.append(','.join(temp_list))
-            if len(prepared_data[key]["dates"]) > 1:
-                for i in range(1, len(prepared_data[key]["dates"])):
-                    result.append(','.join(
-                        ['', '', prepared_data[key]["dates"][i][0],
-                         prepared_data[key]["dates"][i][1], '']))
-                    i += 1
-        return result
+                yield ('', '', date, time_format(spent), '')
 
     def dates_to_export(self, ids):
-        """Prepare date-based tasks list for export."""
-        self.exec_script(
-            "select date, tasks.name, tasks.description, "
-            "spent_time from activity join tasks "
-            "on activity.task_id=tasks.id where task_id in ({0}) "
-            "order by date, tasks.name".
-            format(",".join(map(str, ids))))
-        db_response = [{"date": item[0], "name": item[1],
-                        "descr": item[2] if item[2] else '',
-                        "spent_time": item[3]} for item in self.cur.fetchall()]
-
-        prepared_data = OrderedDict()
-        for item in db_response:
-            if item["date"] in prepared_data:
-                prepared_data[item["date"]]["tasks"].append({
-                    "name": item["name"], "descr": item["descr"],
-                    "spent_time": time_format(item["spent_time"])})
+        """Yields rows of date-based export table. Rows are grouped
+        by date while being read from database."""
+        yield ('Date', 'Tasks', 'Descriptions', 'Time',
+               'Summarized working time')
+        current = None
+        for date, name, descr, spent, total in self.fetch_batches(
+                "SELECT date, tasks.name, tasks.description, spent_time, "
+                "sum(spent_time) OVER (PARTITION BY date) FROM activity "
+                "JOIN tasks ON activity.task_id=tasks.id WHERE task_id IN "
+                "(SELECT value FROM json_each(?)) ORDER BY date, tasks.name",
+                json.dumps(list(ids))):
+            if date != current:
+                current = date
+                yield (date, name, descr or '', time_format(spent),
+                       time_format(total))
             else:
-                prepared_data[item["date"]] = {
-                    "tasks": [{"name": item["name"],
-                               "descr": item["descr"],
-                               "spent_time": time_format(item["spent_time"])}]}
-        self.exec_script(
-            "select date, sum(spent_time) from activity where task_id "
-            "in ({0}) group by date order by date".format(",".join(map(str,
-                                                                       ids))))
-        for item in self.cur.fetchall():
-            prepared_data[item[0]]["spent_total"] = (time_format(item[1]))
-
-        result = [
-            'Date,Tasks,Descriptions,Time,Summarized working time']
-        for key in prepared_data:
-            temp_list = [key,
-                         prepared_data[key]["tasks"][0]["name"],
-                         prepared_data[key]["tasks"][0]["descr"],
-                         prepared_data[key]["tasks"][0]["spent_time"],
-                         prepared_data[key]["spent_total"]]
-            result.append(','.join(temp_list))
-            if len(prepared_data[key]["tasks"]) > 1:
-                for i in range(1, len(prepared_data[key]["tasks"])):
-                    result.append(','.join(
-                        ['',
-                         prepared_data[key]["tasks"][i]["name"],
-                         prepared_data[key]["tasks"][i]["descr"],
-                         prepared_data[key]["tasks"][i]["spent_time"],
-                         '']))
-                    i += 1
-        return result
+                yield ('', name, descr or '', time_format(spent), '')
+
+    def activity_to_export(self, ids):
+        """Yields activity records of given tasks as JSON strings.
+        Time is exported as integer number of seconds."""
+        for row in self.fetch_batches(
+                "SELECT json_object('task_id', tasks.id, 'task', name, "
+                "'description', description, 'creation_date', creation_date, "
+                "'tags', json((SELECT json_group_array(tags.name) "
+                "FROM tasks_tags JOIN tags ON tags.id=tasks_tags.tag_id "
+                "WHERE tasks_tags.task_id=tasks.id)), "
+                "'date', activity.date, "
+                "'spent_time', CAST(round(activity.spent_time) AS INTEGER)) "
+                "FROM tasks JOIN activity ON tasks.id=activity.task_id "
+                "WHERE tasks.id IN (SELECT value FROM json_each(?)) "
+                "ORDER BY tasks.name, activity.date", json.dumps(list(ids))):
+            yield row[0]
 
     def tags_dict(self, taskid):
         """Creates a list of tag ids, their values in (0, 1) and their names
@@ -313,12 +624,269 @@ class Db:
         res.reverse()  # Should be reversed to preserve order like in database.
         return res
 
+    def data_state(self):
+        """Returns value which changes on every commit to database,
+        made by this or another process."""
+        writer = self.pool.writer()
+        with self.pool.write_lock:
+            version = writer.execute("PRAGMA data_version").fetchone()[0]
+            return version, self.pool.write_count
+
+    def cached_result(self, key, function, *args):
+        """Returns result of function(*args), taking it from the result
+        cache while database is not changed. Result should not be
+        modified by caller."""
+        if not self.readonly and self.con.in_transaction:
+            # Changes which are not committed yet can be rolled back:
+            return function(*args)
+        if self.cursors:
+            # Unfinished statement keeps connection on older snapshot
+            # of database, so result can be older than current state:
+            return function(*args)
+        key = (self.pool.filename, *key)
+        # State is taken before query, so result is never older:
+        state = self.data_state()
+        missing = object()
+        result = RESULT_CACHE.get(key, state, missing)
+        if result is missing:
+            result = function(*args)
+            RESULT_CACHE.put(key, state, result)
+        return result
+
+    def tasks_list(self, query, params=()):
+        """Returns (count, total time, rows) of tasks list query.
+        Rows are None if there are more than RESULT_CACHE_ROWS of them,
+        then they should be fetched by cursor."""
+        return self.cached_result(("tasks_list", query, tuple(params)),
+                                  self._tasks_list, query, params)
+
+    def _tasks_list(self, query, params):
+        self.exec_script('SELECT count(*), sum(total_time) FROM ({0})'.format(
+            query), *params)
+        count, fulltime = self.cur.fetchone()
+        rows = None
+        if count <= RESULT_CACHE_ROWS:
+            self.exec_script(query, *params)
+            rows = tuple(self.cur.fetchall())
+        return count, fulltime or 0, rows
+
+    def load_filter(self):
+        """Returns stored filter as dictionary with "mode", "dates" and
+        "tags" keys, or None if filter is not set."""
+        stored = self.cached_result(("filter",), self._load_filter)
+        return copy.deepcopy(stored)
+
+    def _load_filter(self):
+        self.exec_script("SELECT name, value FROM options WHERE name IN "
+                         "('filter', 'filter_operating_mode', "
+                         "'filter_dates', 'filter_tags')")
+        options = dict(self.cur.fetchall())
+        if not options['filter']:
+            return None
+        try:
+            return json.loads(options['filter'])
+        except ValueError:
+            # Filter saved by previous versions as query text:
+            return {"mode": options['filter_operating_mode'],
+                    "dates": [x for x in str(
+                        options['filter_dates']).split(',') if x],
+                    "tags": [int(x) for x in str(
+                        options['filter_tags']).split(',') if x]}
+
+    def save_filter(self, mode="AND", dates=(), tags=()):
+        """Stores filter parameters. Filter without dates and tags
+        is stored as empty."""
+        value = None
+        if dates or tags:
+            value = json.dumps({"mode": mode, "dates": list(dates),
+                                "tags": list(tags)})
+        self.update('filter', field='value', value=value, table='options',
+                    updfield='name')
+
+    def filter_query(self):
+        """Returns query text and parameters to get tasks data
+        according to stored filter. If filter is not set,
+        query returns all tasks."""
+        params = self.load_filter()
+        if params:
+            return prepare_filter_query(params["dates"], params["tags"],
+                                        params["mode"])
+        return TASKS_QUERY, ()
+
+    def search_tasks(self, query, limit=None, within=None, params=(),
+                     ignore_case=True):
+        """Search of tasks by name and description among tasks returned
+        by "within" query with given parameters, all tasks by default.
+        Tasks in which every word of the query is a word prefix are
+        found through full-text index, best matches first. Only if there
+        are no such tasks, query is searched as a substring, including
+        parts inside words, as before the index was added.
+        Returns list of no more than limit task ids, all found tasks
+        if limit is None."""
+        limit = -1 if limit is None else limit
+        source = "JOIN ({0}) AS listed ON listed.id=tasks.id".format(
+            within) if within else ""
+        if ignore_case:
+            pattern = "%{0}%".format(re.sub(r"([\\%_])", r"\\\1", query))
+            condition = "(tasks.name LIKE ? ESCAPE '\\' " \
+                        "OR tasks.description LIKE ? ESCAPE '\\')"
+            values = (pattern, pattern)
+        else:
+            condition = "(instr(tasks.name, ?) OR instr(tasks.description, ?))"
+            values = (query, query)
+        found = []
+        words = re.findall(r'\w+', query)
+        if words:
+            try:
+                # Index ignores case, so exact case is checked separately:
+                self.exec_script(
+                    "SELECT tasks.id FROM tasks_fts "
+                    "JOIN tasks ON tasks.id=tasks_fts.rowid {0} "
+                    "WHERE tasks_fts MATCH ?{1} ORDER BY rank LIMIT ?".format(
+                        source, "" if ignore_case else " AND " + condition),
+                    *params, " ".join('"{0}"*'.format(word) for word in words),
+                    *(() if ignore_case else values), limit)
+                found = [x[0] for x in self.cur.fetchall()]
+            except DbErrors:
+                # SQLite may be built without FTS5 support.
+                pass
+        if not found:
+            self.exec_script("SELECT tasks.id FROM tasks {0} WHERE {1} "
+                             "ORDER BY tasks.id LIMIT ?".format(
+                                 source, condition), *params, *values, limit)
+            found = [x[0] for x in self.cur.fetchall()]
+        return found
+
     def simple_dateslist(self):
         """Returns simple list of all dates of activity without duplicates."""
         self.exec_script(
             'SELECT DISTINCT date FROM activity ORDER BY date DESC')
         return [x[0] for x in self.cur.fetchall()]
 
+    def add_timestamp(self, task_id, event_type, comment, timestamp=None):
+        """Adds timestamp to given task. By default timestamp is total
+        time spent on the task."""
+        if timestamp is None:
+            timestamp = self.select_task(task_id)["spent_total"]
+        self.insert('timestamps', ('task_id', 'timestamp', 'event_type',
+                                   'datetime', 'comment'),
+                    (task_id, timestamp, event_type,
+                     date_format(datetime.datetime.now(),
+                                 DATE_STORAGE_TEMPLATE), comment))
+
+    def running_timers(self):
+        """Returns dictionary of start times of timers started
+        by start_timer(), by task id."""
+        self.exec_script("SELECT task_id, start_time FROM running_tasks "
+                         "WHERE process=0")
+        return {task_id: str_to_date(start, DATE_STORAGE_TEMPLATE)
+                for task_id, start in self.cur.fetchall()}
+
+    def window_timers(self):
+        """Returns dictionary of start times of timers running in tracker
+        windows, by task id. Their time is saved by the windows.
+        If the task runs in several windows, the earliest start
+        is returned."""
+        self.exec_script("SELECT task_id, start_time FROM running_tasks "
+                         "WHERE process<>0 ORDER BY start_time DESC")
+        return {task_id: str_to_date(start, DATE_STORAGE_TEMPLATE)
+                for task_id, start in self.cur.fetchall()}
+
+    def start_window_timer(self, task_id):
+        """Records that timer of the task is running in window
+        of this process. Every process has its own record."""
+        self.exec_script(
+            "INSERT OR IGNORE INTO running_tasks (task_id, start_time, "
+            "process) VALUES (?, ?, ?)", task_id,
+            date_format(datetime.datetime.now(), DATE_STORAGE_TEMPLATE),
+            os.getpid())
+
+    def stop_window_timer(self, task_id):
+        """Removes record made by start_window_timer()."""
+        self.exec_script("DELETE FROM running_tasks WHERE task_id=? "
+                         "AND process=?", task_id, os.getpid())
+
+    def clear_window_timers(self):
+        """Removes records of window timers left by processes which
+        have been terminated. Should be called only when no other
+        tracker window uses the database."""
+        self.exec_script("DELETE FROM running_tasks WHERE process<>0")
+
+    def start_timer(self, task_id):
+        """Starts timer of the task which keeps running after program
+        exit. Start is logged as in main window."""
+        with self.transaction():
+            if task_id in self.running_timers():
+                raise DbErrors("Task is already running")
+            if task_id in self.window_timers():
+                raise DbErrors("Task is running in tracker window")
+            self.insert("running_tasks", ("task_id", "start_time"),
+                        (task_id, date_format(datetime.datetime.now(),
+                                              DATE_STORAGE_TEMPLATE)))
+            self.add_timestamp(task_id, LOG_EVENTS["START"], "Task started.")
+
+    def stop_timer(self, task_id):
+        """Stops timer started by start_timer() and records time spent
+        since its start as an interval. Returns number of seconds
+        spent."""
+        with self.transaction():
+            started = self.running_timers().get(task_id)
+            if started is None:
+                raise DbErrors("Task is not running")
+            stopped = datetime.datetime.now()
+            self.add_intervals([(task_id, started, stopped)])
+            self.exec_script("DELETE FROM running_tasks WHERE task_id=? "
+                             "AND process=0", task_id)
+            self.add_timestamp(task_id, LOG_EVENTS["STOP"], "Task stopped.")
+        return (stopped - started).total_seconds()
+
+    def _timestamps_clause(self, task_id, events):
+        clause = "WHERE task_id=?"
+        params = [task_id]
+        if events is not None:
+            clause += " AND event_type IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(events)))
+        return clause, params
+
+    def timestamps_page(self, task_id, after=None, events=None, limit=None,
+                        order="datetime", reverse=False):
+        """Returns timestamps of the task ordered by given field, "datetime"
+        or "timestamp", as (rowid, timestamp, event_type, datetime, comment)
+        tuples. Page starts after (field value, rowid) key of the last row
+        of previous page, which is returned by timestamps_key().
+        Events is list of LOG_EVENTS values to return, all events
+        by default."""
+        if order not in TIMESTAMPS_ORDERS:
+            raise ValueError("Unknown timestamps order: %s" % order)
+        clause, params = self._timestamps_clause(task_id, events)
+        if after:
+            clause += " AND ({0}, rowid) {1} (?, ?)".format(
+                order, "<" if reverse else ">")
+            params.extend(after)
+        self.exec_script(
+            "SELECT rowid, timestamp, event_type, datetime, comment "
+            "FROM timestamps {0} ORDER BY {1} {2}, rowid {2} LIMIT ?".format(
+                clause, order, "DESC" if reverse else "ASC"),
+            *params, limit or TIMESTAMPS_PAGE)
+        return self.cur.fetchall()
+
+    @staticmethod
+    def timestamps_key(row, order="datetime"):
+        """Key of timestamps_page() row which next page starts after."""
+        return row[TIMESTAMPS_ORDERS[order]], row[0]
+
+    def count_timestamps(self, task_id, events=None):
+        """Returns number of timestamps of the task."""
+        clause, params = self._timestamps_clause(task_id, events)
+        self.exec_script("SELECT count(*) FROM timestamps " + clause, *params)
+        return self.cur.fetchone()[0]
+
+    def delete_timestamps(self, rowids):
+        """Removes timestamps with given rowids by one statement."""
+        self.exec_script("DELETE FROM timestamps WHERE rowid IN "
+                         "(SELECT value FROM json_each(?))",
+                         json.dumps([int(x) for x in rowids]))
+
     def timestamps(self, taskid, task_total_spent_time):
         """Returns timestamps list in same format as simple_tagslist()."""
         timestamps = self.find_by_clause('timestamps', 'task_id', taskid,
@@ -330,90 +898,357 @@ class Db:
         return res
 
 
+class ResultCache:
+    """Cache of query results, least recently used ones are dropped.
+    Every result is stored with database state it has been read in,
+    and is valid only while the state is the same."""
+
+    def __init__(self, size=None):
+        self.size = size or RESULT_CACHE_SIZE
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, state, default=None):
+        """Returns result for given key, or default if there is no
+        valid one."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != state:
+                return default
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, state, result):
+        with self._lock:
+            self.entries[key] = (state, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+class TaskCache:
+    """In-process cache of tasks data loaded by Db.select_tasks().
+    Data is valid only for the date it has been loaded on. Every
+    invalidation increases generation, and data loaded by a query
+    started before it is not stored."""
+
+    def __init__(self):
+        self.tasks = {}
+        self.date = None
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, ids, date):
+        """Returns copies of cached tasks, list of ids which are not
+        cached and current generation."""
+        with self._lock:
+            if date != self.date:
+                self.tasks = {}
+                self.date = date
+            found = {x: dict(self.tasks[x]) for x in ids if x in self.tasks}
+            return (found, [x for x in ids if x not in found],
+                    self.generation)
+
+    def put(self, tasks, date, generation):
+        with self._lock:
+            if generation == self.generation and date == self.date:
+                self.tasks.update((x, dict(tasks[x])) for x in tasks)
+
+    def invalidate(self, ids=None):
+        """Drops given tasks. Drops everything if ids is None."""
+        with self._lock:
+            self.generation += 1
+            if ids is None:
+                self.tasks = {}
+            else:
+                for task_id in ids:
+                    self.tasks.pop(task_id, None)
+
+
+class Persister(threading.Thread):
+    """Background writer of tasks spent time.
+    Timers queue time spent since previous save, and the thread records
+    it as intervals of work in one transaction per interval."""
+
+    def __init__(self, interval=None):
+        super().__init__(daemon=True)
+        self.interval = interval or PERSIST_INTERVAL
+        self.queue = queue.SimpleQueue()
+        self.db = Db()
+        # Intervals which have been taken from queue but not saved yet:
+        self.pending = []
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def save(self, task_id, delta, prev_date):
+        """Queues time spent on the task since previous save as interval
+        which ends now. Does not touch database. Returns the same result
+        as Db.update_task() on date change."""
+        if delta > 0:
+            stop = datetime.datetime.now()
+            self.queue.put((task_id, stop - datetime.timedelta(seconds=delta),
+                            stop))
+        return split_time_delta(delta, prev_date)[1]
+
+    def flush(self):
+        """Writes all queued values to database synchronously.
+        Unsaved values are kept for next attempt if DbErrors raised."""
+        # Write lock is taken first, so flush can be called from
+        # inside of Db.transaction() block of another thread:
+        with self.db.pool.write_lock, self._flush_lock:
+            while True:
+                try:
+                    self.pending.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self.pending:
+                intervals, self.pending = self.pending, []
+                try:
+                    self.db.add_intervals(intervals)
+                except BaseException:
+                    self.pending = intervals + self.pending
+                    raise
+                # Inside of a transaction of another caller intervals
+                # are saved only if it is committed:
+                self.db.after_transaction(
+                    lambda committed: committed or self._restore(intervals))
+
+    def _restore(self, intervals):
+        """Returns intervals lost by rollback to pending ones."""
+        with self._flush_lock:
+            self.pending = intervals + self.pending
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except DbErrors:
+                pass
+
+    def stop(self):
+        """Stops the thread and saves everything that remains in queue."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.flush()
+
+
+def time_persister():
+    """Returns running background persister. Starts it on first call."""
+    global _PERSISTER
+    with _PERSISTER_LOCK:
+        if _PERSISTER is None:
+            _PERSISTER = Persister()
+            _PERSISTER.start()
+        return _PERSISTER
+
+
+def stop_persister():
+    """Saves queued values and stops background persister."""
+    global _PERSISTER
+    with _PERSISTER_LOCK:
+        if _PERSISTER is not None:
+            _PERSISTER.stop()
+            _PERSISTER = None
+
+
+def split_spent_time(value, prev_date):
+    """Splits time spent on a task since prev_date between prev_date and
+    today. Returns list of (date, spent_time) pairs and, if date has
+    changed, named tuple with time remained for today and current date."""
+    current_date = today()
+    if current_date == prev_date:
+        return [(prev_date, value)], None
+    now = datetime.datetime.now()
+    today_secs = datetime.timedelta(
+        hours=now.hour, minutes=now.minute,
+        seconds=now.second).total_seconds()
+    return ([(prev_date, value - today_secs), (current_date, today_secs)],
+            namedtuple("res", "remained,current_date")(today_secs,
+                                                       current_date))
+
+
+def split_time_delta(delta, prev_date):
+    """Splits time spent on a task since prev_date between prev_date and
+    today: time after midnight is counted for today. Returns the same
+    values as split_spent_time(). Used to update displayed time only:
+    saved intervals are split by compaction."""
+    current_date = today()
+    if current_date == prev_date:
+        return [(prev_date, delta)], None
+    now = datetime.datetime.now()
+    today_secs = min(delta, datetime.timedelta(
+        hours=now.hour, minutes=now.minute,
+        seconds=now.second).total_seconds())
+    return ([(prev_date, delta - today_secs), (current_date, today_secs)],
+            namedtuple("res", "remained,current_date")(today_secs,
+                                                       current_date))
+
+
+def is_busy(err):
+    """Checks if database error is caused by lock of another connection."""
+    code = getattr(err, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(err) or "busy" in str(err)
+
+
+class InstanceLock:
+    """Advisory lock which shows that database is used by a running
+    program instance. Lock file is placed next to database file.
+    Lock is released by OS if the process exits without release()."""
+
+    def __init__(self, filename=None):
+        self.path = (filename or TABLE_FILE) + ".lock"
+        self.fd = None
+
+    def acquire(self):
+        """Takes the lock. Returns False if it is held by another
+        process."""
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
 def prepare_filter_query(dates, tags, mode):
-    """Query to get filtered tasks data from database."""
+    """Query to get filtered tasks data from database.
+    Returns constant query text and its parameters: selected dates
+    and tags are bound as JSON arrays. They are sorted, so the same
+    filter always gives the same parameters."""
+    dates_json = json.dumps(sorted(set(dates)))
+    tags_json = json.dumps(sorted(set(tags)))
     if mode == "OR":
-        return 'SELECT id, name, total_time, description, ' \
-               'creation_date FROM tasks JOIN activity ' \
-               'ON activity.task_id=tasks.id JOIN tasks_tags ' \
-               'ON tasks_tags.task_id=tasks.id ' \
-               'JOIN (SELECT task_id, sum(spent_time) ' \
-               'AS total_time ' \
-               'FROM activity GROUP BY task_id) AS act ' \
-               'ON act.task_id=tasks.id WHERE date IN ({1}) ' \
-               'OR tag_id IN ({0}) ' \
-               'GROUP BY act.task_id'. \
-            format(",".join(map(str, tags)), "'%s'" % "','".join(dates))
+        return FILTER_QUERIES["OR"], (dates_json, tags_json)
+    elif dates and tags:
+        return FILTER_QUERIES["AND"], (dates_json, tags_json)
+    elif not dates:
+        return FILTER_QUERIES["AND_TAGS"], (tags_json,)
     else:
-        if dates and tags:
-            return 'SELECT DISTINCT id, name, total_time, ' \
-                   'description, creation_date FROM tasks  JOIN ' \
-                   '(SELECT task_id, sum(spent_time) AS total_time ' \
-                   'FROM activity WHERE activity.date IN ({0}) ' \
-                   'GROUP BY task_id) AS act ' \
-                   'ON act.task_id=tasks.id JOIN (SELECT tt.task_id' \
-                   ' FROM tasks_tags AS tt WHERE ' \
-                   'tt.tag_id IN ({1}) GROUP BY tt.task_id ' \
-                   'HAVING COUNT(DISTINCT tt.tag_id)={3}) AS x ON ' \
-                   'x.task_id=tasks.id JOIN (SELECT act.task_id ' \
-                   'FROM activity AS act WHERE act.date IN ({0}) ' \
-                   'GROUP BY act.task_id HAVING ' \
-                   'COUNT(DISTINCT act.date)={2}) AS y ON ' \
-                   'y.task_id=tasks.id'. \
-                format("'%s'" % "','".join(dates),
-                       ",".join(map(str, tags)), len(dates), len(tags))
-        elif not dates:
-            return 'SELECT DISTINCT id, name, total_time, ' \
-                   'description, creation_date FROM tasks  ' \
-                   'JOIN (SELECT task_id, sum(spent_time) ' \
-                   'AS total_time FROM activity GROUP BY ' \
-                   'task_id) AS act ON act.task_id=tasks.id ' \
-                   'JOIN (SELECT tt.task_id FROM tasks_tags ' \
-                   'AS tt WHERE tt.tag_id IN ({0}) GROUP BY ' \
-                   'tt.task_id HAVING ' \
-                   'COUNT(DISTINCT tt.tag_id)={1}) AS x ON ' \
-                   'x.task_id=tasks.id'. \
-                format(",".join(map(str, tags)), len(tags))
-        elif not tags:
-            return 'SELECT DISTINCT id, name, total_time, ' \
-                   'description, creation_date FROM tasks  ' \
-                   'JOIN (SELECT task_id, sum(spent_time) ' \
-                   'AS total_time FROM activity WHERE activity.date' \
-                   ' IN ({0}) GROUP BY task_id) AS act ' \
-                   'ON act.task_id=tasks.id JOIN (SELECT ' \
-                   'act.task_id FROM activity AS act ' \
-                   'WHERE act.date IN ({0}) GROUP BY act.task_id ' \
-                   'HAVING COUNT(DISTINCT act.date)={1}) AS y ' \
-                   'ON y.task_id=tasks.id'.format("'%s'" % "','"
-                                                  .join(dates), len(dates))
+        return FILTER_QUERIES["AND_DATES"], (dates_json,)
+
+
+class StartupTimer:
+    """Measures durations of consecutive startup phases."""
+
+    def __init__(self, start=None):
+        self.start = self.last = start or time.perf_counter()
+        self.phases = []
+
+    def phase(self, name):
+        """Marks end of the phase with given name."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        """Returns durations of all phases and total time, ms."""
+        return ", ".join("{0}: {1:.1f} ms".format(name, duration * 1000)
+                         for name, duration in self.phases + [
+                             ("total", self.last - self.start)])
+
+
+def bootstrap(timer=None):
+    """Prepares database and loads everything needed at startup
+    using the shared write connection: options and preserved tasks.
+    Returns options dictionary and dictionary of preserved tasks."""
+    timer = timer or StartupTimer()
+    check_database()
+    timer.phase("database check")
+    db = Db()
+    options = db.options()
+    timer.phase("options")
+    tasks = {}
+    if options["tasks"]:
+        tasks = db.select_tasks(map(int, str(options["tasks"]).split(",")))
+    timer.phase("preserved tasks")
+    return options, tasks
 
 
 def check_database():
     """Check if database file exists."""
     if not os.path.exists(TABLE_FILE):
-        with sqlite3.connect(TABLE_FILE) as con:
-            con.executescript(TABLE_STRUCTURE)
-            con.commit()
+        con = connection_pool().writer()
+        con.executescript(TABLE_STRUCTURE)
+        con.commit()
     patch_database()
 
 
-def write_to_disk(filename, text):
-    """Creates file and fills it with given text."""
-    with open(filename, 'w') as expfile:
-        expfile.write(text)
+def csv_lines(rows):
+    """Yields given rows formatted as comma-separated values.
+    Lines are separated by newlines, last line has no newline."""
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator='')
+    separator = ''
+    for row in rows:
+        writer.writerow(row)
+        yield separator + line.getvalue()
+        line.seek(0)
+        line.truncate()
+        separator = '\n'
+
+
+def write_csv(filename, rows, opener=open):
+    """Creates file and writes given rows to it as comma-separated
+    values. Rows are written one by one as they are produced.
+    Opener is a function used to open file in text mode."""
+    with opener(filename, 'wt') as expfile:
+        for line in csv_lines(rows):
+            expfile.write(line)
 
 
 def time_format(sec):
     """Returns time string in readable format."""
-    days = int(sec // 86400)
-    time_ = time.strftime("%H:%M:%S", time.gmtime(sec % 86400))
-    prefix = "%d days, " % days
+    # Fractions of second are not shown, so whole seconds are cached:
+    return _cached_seconds_format(int(sec // 1))
+
+
+def _seconds_format(sec):
+    days, sec = divmod(sec, 86400)
     if days == 0:
-        prefix = ''
-    elif str(days).endswith("1"):
-        if days != 11:
-            prefix = "{} day, ".format(days)
-    return "{}{}".format(prefix, time_)
+        return "%02d:%02d:%02d" % (sec // 3600, sec // 60 % 60, sec % 60)
+    return "%d %s, %02d:%02d:%02d" % (
+        days, "day" if abs(days) % 10 == 1 and days != 11 else "days",
+        sec // 3600, sec // 60 % 60, sec % 60)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_seconds_format(sec):
+    return _seconds_format(sec)
+
+
+def time_format_column(values):
+    """Returns list of formatted times for given sequence of seconds.
+    Every distinct value is formatted only once."""
+    formatted = {}
+    result = []
+    for value in values:
+        sec = int(value // 1)
+        text = formatted.get(sec)
+        if text is None:
+            text = formatted[sec] = _seconds_format(sec)
+        result.append(text)
+    return result
 
 
 def date_format(date, template=DATE_TEMPLATE):
@@ -430,13 +1265,26 @@ def today():
     return date_format(datetime.datetime.now())
 
 
+@functools.lru_cache(maxsize=4096)
 def table_date_format(string, template=DATE_FULL_HUMAN_READABLE_TEMPLATE):
     """Formats date stored in database to more human-readable"""
-    return date_format(str_to_date(string, DATE_STORAGE_TEMPLATE), template)
+    if template == DATE_FULL_HUMAN_READABLE_TEMPLATE \
+            and len(string) == 26 and string[10] == 'T':
+        # Stored date already contains all needed parts:
+        return string[:10] + ' ' + string[11:19]
+    return date_format(datetime.datetime.fromisoformat(string), template)
+
 
+def table_date_format_column(strings,
+                             template=DATE_FULL_HUMAN_READABLE_TEMPLATE):
+    """Returns list of formatted dates for given sequence
+    of stored dates."""
+    return [table_date_format(x, template) for x in strings]
 
+
+@functools.lru_cache(maxsize=None)
 def get_help():
-    """Reading help from the file."""
+    """Reading help from the file. File is read on first call."""
     try:
         with open('resource/help.txt', encoding='UTF-8') as helpfile:
             helptext = helpfile.read()
@@ -445,42 +1293,166 @@ def get_help():
     return helptext
 
 
-def patch_database():
-    """Apply patches to database."""
-    con = sqlite3.connect(TABLE_FILE)
-    cur = con.cursor()
-    cur.execute("SELECT value FROM options WHERE name='patch_ver';")
-    res = cur.fetchone()
-    key = 0
-    if not res:
-        for key in sorted(PATCH_SCRIPTS):
+def patch_database(con=None):
+    """Apply patches to database. By default main database
+    is patched. Version is saved after every applied patch, so patching
+    stops at failed patch and continues from it on next start.
+    Failed optional patches are skipped and tried again on every start."""
+    con = con or connection_pool().writer()
+    skipped = skipped_patches(con)
+    for key in sorted(PATCH_SCRIPTS):
+        if patch_version(con) >= key and key not in skipped:
+            continue
+        try:
             apply_script(PATCH_SCRIPTS[key], con)
-        res = (1,)
-    else:
-        for key in sorted(PATCH_SCRIPTS):
-            if int(res[0]) < key:
-                apply_script(PATCH_SCRIPTS[key], con)
-    if res[0] != key:
-        con.executescript(
-            "UPDATE options SET value={0} WHERE name='patch_ver';".format(key))
+        except sqlite3.DatabaseError:
+            if key in skipped:
+                continue
+            # Patch may be applied by another process meanwhile:
+            if patch_version(con) >= key:
+                continue
+            if key not in OPTIONAL_PATCHES:
+                raise
+            skipped.add(key)
+        else:
+            skipped.discard(key)
+        con.execute("INSERT OR REPLACE INTO options VALUES ('patch_ver', ?);",
+                    (max(key, patch_version(con)),))
+        con.execute("INSERT OR REPLACE INTO options "
+                    "VALUES ('skipped_patches', ?);",
+                    (",".join(map(str, sorted(skipped))),))
         con.commit()
-    con.close()
+
+
+def patch_version(con):
+    """Returns number of the last patch applied to database."""
+    res = con.execute(
+        "SELECT value FROM options WHERE name='patch_ver';").fetchone()
+    return int(res[0] or 0) if res else 0
+
+
+def skipped_patches(con):
+    """Returns set of optional patches which could not be applied."""
+    res = con.execute(
+        "SELECT value FROM options WHERE name='skipped_patches';").fetchone()
+    return {int(x) for x in str(res[0] or "").split(",") if x} \
+        if res else set()
 
 
 def apply_script(scripts_list, db_connection):
+    """Executes scripts of a patch. Partially applied script is
+    rolled back and the error is raised."""
     for script in scripts_list:
         try:
             db_connection.executescript(script)
             db_connection.commit()
         except sqlite3.DatabaseError:
-            pass
+            db_connection.rollback()
+            raise
 
 
 CREATOR_NAME = "Alexey Kallistov"
 TITLE = "Time tracker"
 ABOUT_MESSAGE = "Time tracker {0}\nCopyright (c)\n{1},\n{2}"
-HELP_TEXT = get_help()
 TABLE_FILE = 'tasks.db'
+# Number of read connections in the pool:
+READ_POOL_SIZE = 4
+# Applied once to every new connection:
+CONNECTION_PRAGMAS = (
+    "PRAGMA cache_size=-16000;",    # 16 MB
+    "PRAGMA mmap_size=268435456;",  # 256 MB
+    "PRAGMA temp_store=MEMORY;"
+)
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+# Seconds to wait for lock of another connection:
+BUSY_TIMEOUT = 10
+# Statement which failed because of lock is repeated this number
+# of times, with delays starting from RETRY_DELAY seconds:
+RETRY_ATTEMPTS = 5
+RETRY_DELAY = 0.05
+# Number of timestamps loaded at once:
+TIMESTAMPS_PAGE = 500
+# Fields timestamps can be ordered by, with their positions in rows
+# of timestamps_page():
+TIMESTAMPS_ORDERS = {"datetime": 3, "timestamp": 1}
+# Tables which changes make cached tasks data invalid:
+CACHED_TABLES = ("tasks", "activity", "tasks_tags")
+# Number of cached query results:
+RESULT_CACHE_SIZE = 16
+# Larger tasks lists are not cached, only their count and total time:
+RESULT_CACHE_ROWS = 100000
+RESULT_CACHE = ResultCache()
+TASK_CACHE = TaskCache()
+# Number of rows read from database at once during export:
+EXPORT_BATCH = 1000
+# Interval between background saves of timers values, seconds:
+PERSIST_INTERVAL = 5
+_PERSISTER = None
+_PERSISTER_LOCK = threading.Lock()
+# Basic script for retrieving tasks from database:
+TASKS_QUERY = "SELECT id, name, total_time, description, creation_date " \
+              "FROM tasks JOIN task_totals AS act ON act.task_id=tasks.id"
+# Adds time of intervals following the last compacted one to activity.
+# Every interval is split into parts by days, any number of them:
+COMPACT_INTERVALS = """\
+WITH RECURSIVE parts (task_id, start, stop) AS (
+    SELECT task_id, start, stop FROM intervals
+    WHERE id > (SELECT last_id FROM intervals_compacted)
+    UNION ALL
+    SELECT task_id, strftime('%Y-%m-%dT%H:%M:%S', date(start, '+1 day')),
+        stop FROM parts
+    WHERE julianday(date(start, '+1 day')) < julianday(stop)
+)
+INSERT INTO activity (date, task_id, spent_time)
+SELECT date(start), task_id, round(sum((julianday(min(stop, strftime(
+    '%Y-%m-%dT%H:%M:%S', date(start, '+1 day')))) - julianday(start))
+    * 86400), 3)
+-- Stored times have fractions, so they are compared as numbers;
+-- parts of zero length (interval stopped at midnight) are skipped:
+FROM parts WHERE julianday(start) < julianday(stop)
+GROUP BY task_id, date(start)
+ON CONFLICT (task_id, date) DO UPDATE SET
+    spent_time=spent_time+excluded.spent_time"""
+# Filter queries. Parameters ?1 and ?2 are JSON arrays of dates and tags:
+FILTER_QUERIES = {
+    # Tasks which have activity on any of dates or any of tags:
+    "OR": "SELECT id, name, total_time, description, creation_date "
+          "FROM tasks JOIN task_totals AS act ON act.task_id=tasks.id "
+          "WHERE EXISTS (SELECT 1 FROM tasks_tags "
+          "WHERE tasks_tags.task_id=tasks.id) AND ("
+          "tasks.id IN (SELECT task_id FROM activity WHERE date IN "
+          "(SELECT value FROM json_each(?1))) OR "
+          "tasks.id IN (SELECT task_id FROM tasks_tags WHERE tag_id IN "
+          "(SELECT value FROM json_each(?2))))",
+    # Tasks which have activity on all of dates and all of tags.
+    # Time is counted only for selected dates:
+    "AND": "SELECT id, name, total_time, description, creation_date "
+           "FROM tasks JOIN (SELECT task_id, sum(spent_time) AS total_time "
+           "FROM activity WHERE date IN (SELECT value FROM json_each(?1)) "
+           "GROUP BY task_id HAVING COUNT(DISTINCT date)="
+           "(SELECT COUNT(DISTINCT value) FROM json_each(?1))) AS act "
+           "ON act.task_id=tasks.id JOIN (SELECT task_id FROM tasks_tags "
+           "WHERE tag_id IN (SELECT value FROM json_each(?2)) "
+           "GROUP BY task_id HAVING COUNT(DISTINCT tag_id)="
+           "(SELECT COUNT(DISTINCT value) FROM json_each(?2))) AS x "
+           "ON x.task_id=tasks.id",
+    "AND_TAGS": "SELECT id, name, total_time, description, creation_date "
+                "FROM tasks JOIN task_totals AS act "
+                "ON act.task_id=tasks.id JOIN (SELECT task_id "
+                "FROM tasks_tags WHERE tag_id IN "
+                "(SELECT value FROM json_each(?1)) GROUP BY task_id "
+                "HAVING COUNT(DISTINCT tag_id)="
+                "(SELECT COUNT(DISTINCT value) FROM json_each(?1))) AS x "
+                "ON x.task_id=tasks.id",
+    "AND_DATES": "SELECT id, name, total_time, description, creation_date "
+                 "FROM tasks JOIN (SELECT task_id, "
+                 "sum(spent_time) AS total_time FROM activity "
+                 "WHERE date IN (SELECT value FROM json_each(?1)) "
+                 "GROUP BY task_id HAVING COUNT(DISTINCT date)="
+                 "(SELECT COUNT(DISTINCT value) FROM json_each(?1))) AS act "
+                 "ON act.task_id=tasks.id"
+}
 LOG_EVENTS = {
     "START": 0,
     "STOP": 1,
@@ -527,4 +1499,153 @@ TABLE_STRUCTURE = """\
 #     "UPDATE options SET value='2.0' WHERE name='version';"
 # ]
 # }
-PATCH_SCRIPTS = {}
+# Patches which need features SQLite can be built without. Program
+# works without them: full-text index (FTS5) is replaced by substring
+# search. Skipped patches are tried again on every start:
+OPTIONAL_PATCHES = {4}
+PATCH_SCRIPTS = {
+    1: [
+        # Merge duplicated activity rows and make (task_id, date) unique.
+        # Unique index also serves all lookups by task_id:
+        """\
+        BEGIN;
+        CREATE TEMP TABLE activity_merged AS
+            SELECT date, task_id, sum(spent_time) AS spent_time
+            FROM activity GROUP BY task_id, date;
+        DELETE FROM activity;
+        INSERT INTO activity (date, task_id, spent_time)
+            SELECT date, task_id, spent_time FROM activity_merged;
+        DROP TABLE activity_merged;
+        CREATE UNIQUE INDEX IF NOT EXISTS activity_task_date
+            ON activity (task_id, date);
+        COMMIT;
+        """,
+        "CREATE INDEX IF NOT EXISTS activity_date "
+        "ON activity (date, task_id, spent_time);",
+        "CREATE INDEX IF NOT EXISTS tasks_tags_tag_task "
+        "ON tasks_tags (tag_id, task_id);",
+        "CREATE INDEX IF NOT EXISTS timestamps_task_datetime "
+        "ON timestamps (task_id, datetime);",
+        "ANALYZE;"
+    ],
+    2: [
+        # Total spent time for every task, maintained by triggers:
+        """\
+        BEGIN;
+        CREATE TABLE task_totals (task_id INTEGER PRIMARY KEY,
+            total_time INT);
+        INSERT INTO task_totals (task_id, total_time)
+            SELECT task_id, sum(spent_time) FROM activity GROUP BY task_id;
+        CREATE TRIGGER activity_insert_total AFTER INSERT ON activity
+        BEGIN
+            INSERT INTO task_totals (task_id, total_time)
+                VALUES (new.task_id, new.spent_time)
+                ON CONFLICT (task_id)
+                DO UPDATE SET total_time=total_time + excluded.total_time;
+        END;
+        CREATE TRIGGER activity_update_total
+            AFTER UPDATE OF task_id, spent_time ON activity
+        BEGIN
+            UPDATE task_totals SET total_time=total_time - old.spent_time
+                WHERE task_id=old.task_id;
+            INSERT INTO task_totals (task_id, total_time)
+                VALUES (new.task_id, new.spent_time)
+                ON CONFLICT (task_id)
+                DO UPDATE SET total_time=total_time + excluded.total_time;
+        END;
+        CREATE TRIGGER activity_delete_total AFTER DELETE ON activity
+        BEGIN
+            UPDATE task_totals SET total_time=total_time - old.spent_time
+                WHERE task_id=old.task_id;
+            DELETE FROM task_totals WHERE task_id=old.task_id
+                AND NOT EXISTS (SELECT 1 FROM activity
+                                WHERE task_id=old.task_id);
+        END;
+        CREATE TRIGGER tasks_delete_total AFTER DELETE ON tasks
+        BEGIN
+            DELETE FROM task_totals WHERE task_id=old.id;
+        END;
+        COMMIT;
+        """
+    ],
+    3: [
+        # Used for sorting of tasks list:
+        "CREATE INDEX IF NOT EXISTS task_totals_time "
+        "ON task_totals (total_time);",
+        "CREATE INDEX IF NOT EXISTS tasks_creation_date "
+        "ON tasks (creation_date);"
+    ],
+    4: [
+        # Full-text index of tasks names and descriptions:
+        """\
+        BEGIN;
+        CREATE VIRTUAL TABLE tasks_fts USING fts5(name, description,
+            content='tasks', content_rowid='id', prefix='2 3');
+        CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+        END;
+        CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+        END;
+        CREATE TRIGGER tasks_fts_update
+            AFTER UPDATE OF name, description ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO tasks_fts (rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+        END;
+        INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');
+        COMMIT;
+        """
+    ],
+    5: [
+        # Timers started from command line, which have to survive
+        # between program runs:
+        "CREATE TABLE running_tasks (task_id INTEGER PRIMARY KEY, "
+        "start_time TEXT);"
+    ],
+    6: [
+        # Append-only journal of work intervals. Their time is added
+        # to activity by compaction, up to last_id:
+        """\
+        BEGIN;
+        CREATE TABLE intervals (id INTEGER PRIMARY KEY, task_id INT,
+            start TEXT, stop TEXT);
+        CREATE INDEX intervals_task_start ON intervals (task_id, start);
+        CREATE TABLE intervals_compacted (last_id INT);
+        INSERT INTO intervals_compacted VALUES (0);
+        COMMIT;
+        """
+    ],
+    7: [
+        # Used for sorting of timestamps window by timestamp:
+        "CREATE INDEX IF NOT EXISTS timestamps_task_timestamp "
+        "ON timestamps (task_id, timestamp);"
+    ],
+    8: [
+        # Timers running in tracker windows are also listed, with id
+        # of the process which saves their time. Command line timers
+        # have no process:
+        "ALTER TABLE running_tasks ADD COLUMN process INT;"
+    ],
+    9: [
+        # Several windows can run timer of the same task, so every
+        # process has its own record. Command line timers have process 0:
+        """\
+        BEGIN;
+        CREATE TABLE running_tasks_owned (task_id INT, start_time TEXT,
+            process INT NOT NULL DEFAULT 0, PRIMARY KEY (task_id, process));
+        INSERT OR IGNORE INTO running_tasks_owned
+            SELECT task_id, start_time, coalesce(process, 0)
+            FROM running_tasks;
+        DROP TABLE running_tasks;
+        ALTER TABLE running_tasks_owned RENAME TO running_tasks;
+        COMMIT;
+        """
+    ]
+}
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+from contextlib import suppress
+import gzip
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+import core
+
+
+class Writer:
+    """Base export format. Rows are produced by rows() from database
+    and consumed by write() which creates the file. Text formats
+    which have media type can be also produced as lines of text."""
+    extension = ''
+    filetype = ("All files", "*.*")
+    media_type = None
+
+    def estimate(self, db, ids):
+        """Returns expected number of rows."""
+        db.exec_script("SELECT count(*) FROM activity WHERE task_id IN "
+                       "(SELECT value FROM json_each(?))",
+                       json.dumps(list(ids)))
+        return db.cur.fetchone()[0]
+
+    def rows(self, db, ids):
+        raise NotImplementedError
+
+    def write(self, filename, rows):
+        raise NotImplementedError
+
+    def interrupt(self):
+        """Called from another thread to stop running write() early.
+        Writers which check rows between steps need nothing here."""
+
+    def lines(self, rows):
+        """Yields text of the file, line by line."""
+        raise NotImplementedError
+
+
+class CsvWriter(Writer):
+    """Task-based comma-separated table."""
+    extension = '.csv'
+    filetype = ("Comma-separated texts", "*.csv")
+    media_type = "text/csv"
+    opener = staticmethod(open)
+
+    def estimate(self, db, ids):
+        # One more row for header:
+        return super().estimate(db, ids) + 1
+
+    def rows(self, db, ids):
+        return db.tasks_to_export(ids)
+
+    def write(self, filename, rows):
+        core.write_csv(filename, rows, self.opener)
+
+    def lines(self, rows):
+        return core.csv_lines(rows)
+
+
+class DatesCsvWriter(CsvWriter):
+    """Date-based comma-separated table."""
+
+    def rows(self, db, ids):
+        return db.dates_to_export(ids)
+
+
+class JsonLinesWriter(Writer):
+    """One JSON object per line for every task activity record."""
+    extension = '.jsonl'
+    filetype = ("JSON Lines", "*.jsonl")
+    media_type = "application/x-ndjson"
+    opener = staticmethod(open)
+
+    def rows(self, db, ids):
+        return db.activity_to_export(ids)
+
+    def write(self, filename, rows):
+        with self.opener(filename, 'wt', encoding='UTF-8') as expfile:
+            for line in self.lines(rows):
+                expfile.write(line)
+
+    def lines(self, rows):
+        return (row + '\n' for row in rows)
+
+
+class GzipCsvWriter(CsvWriter):
+    extension = '.csv.gz'
+    filetype = ("Compressed comma-separated texts", "*.csv.gz")
+    media_type = None
+    opener = staticmethod(gzip.open)
+
+
+class GzipDatesCsvWriter(DatesCsvWriter):
+    extension = '.csv.gz'
+    filetype = ("Compressed comma-separated texts", "*.csv.gz")
+    media_type = None
+    opener = staticmethod(gzip.open)
+
+
+class GzipJsonLinesWriter(JsonLinesWriter):
+    extension = '.jsonl.gz'
+    filetype = ("Compressed JSON Lines", "*.jsonl.gz")
+    media_type = None
+    opener = staticmethod(gzip.open)
+
+
+class SqliteWriter(Writer):
+    """New database file which contains only given tasks with their
+    activity, tags and timestamps. Rows are (source database, table,
+    tasks ids) tuples: every row copies one table."""
+    extension = '.db'
+    filetype = ("Databases", "*.db")
+
+    def __init__(self):
+        # Connection of running write(), guarded by lock:
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def estimate(self, db, ids):
+        return len(SUBSET_SCRIPTS)
+
+    def rows(self, db, ids):
+        source = os.path.abspath(db.pool.filename)
+        ids = json.dumps(list(ids))
+        return ((source, table, ids) for table in SUBSET_SCRIPTS)
+
+    def write(self, filename, rows):
+        with suppress(FileNotFoundError):
+            os.remove(filename)
+        con = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock:
+            self.connection = con
+        try:
+            con.executescript(core.TABLE_STRUCTURE)
+            core.patch_database(con)
+            attached = False
+            for source, table, ids in rows:
+                if not attached:
+                    con.execute("ATTACH DATABASE ? AS source", (source,))
+                    con.execute("BEGIN")
+                    attached = True
+                con.execute(SUBSET_SCRIPTS[table], (ids,))
+            if attached:
+                con.commit()
+                con.execute("DETACH DATABASE source")
+        except sqlite3.DatabaseError as err:
+            raise core.DbErrors(err)
+        finally:
+            with self.lock:
+                self.connection = None
+            con.close()
+
+    def interrupt(self):
+        """Aborts copying of a table, which can take long for big ones."""
+        with self.lock:
+            if self.connection:
+                self.connection.interrupt()
+
+
+def register_writer(name, writer):
+    """Makes writer class available under given name."""
+    WRITERS[name] = writer
+
+
+def export_tasks(ids, filename, writer="CSV, task-based", db=None):
+    """Exports given tasks to file using writer with given name."""
+    exporter = WRITERS[writer]()
+    if db:
+        exporter.write(filename, exporter.rows(db, ids))
+    else:
+        db = core.Db(readonly=True)
+        try:
+            exporter.write(filename, exporter.rows(db, ids))
+        finally:
+            db.close()
+
+
+class ExportJob(threading.Thread):
+    """Background export of tasks to file. Uses its own read connection.
+    Progress messages are put into queue as (state, rows_done,
+    rows_total, error) tuples; state is one of "progress", "done",
+    "cancelled" and "error". Total number of rows is an estimation."""
+
+    def __init__(self, writer, ids, filename):
+        super().__init__(daemon=True)
+        self.writer = WRITERS[writer]()
+        self.ids = ids
+        self.filename = filename
+        self.queue = queue.SimpleQueue()
+        self.rows_done = 0
+        self.rows_total = 0
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Stops export. Partially written file is removed.
+        Can be called from any thread, does not wait for the job."""
+        self._cancel_event.set()
+        self.writer.interrupt()
+
+    def rows(self, db):
+        """Yields rows to be exported while export is not cancelled."""
+        for row in self.writer.rows(db, self.ids):
+            if self._cancel_event.is_set():
+                break
+            yield row
+            self.rows_done += 1
+            if self.rows_done % core.EXPORT_BATCH == 0:
+                self.queue.put(("progress", self.rows_done, self.rows_total,
+                                None))
+
+    def run(self):
+        db = core.Db(readonly=True)
+        try:
+            self.rows_total = self.writer.estimate(db, self.ids)
+            self.queue.put(("progress", 0, self.rows_total, None))
+            self.writer.write(self.filename, self.rows(db))
+        except (core.DbErrors, OSError) as err:
+            # Interrupted writer fails, but it is just cancelling:
+            if not self._cancel_event.is_set():
+                self.queue.put(("error", self.rows_done, self.rows_total,
+                                err))
+                return
+        finally:
+            db.close()
+        if self._cancel_event.is_set():
+            with suppress(OSError):
+                os.remove(self.filename)
+            self.queue.put(("cancelled", self.rows_done, self.rows_total,
+                            None))
+        else:
+            self.queue.put(("done", self.rows_done, self.rows_total, None))
+
+
+# Copying of tasks subset from attached source database.
+# Parameter is JSON array of tasks ids:
+SUBSET_SCRIPTS = {
+    "tasks": "INSERT INTO tasks (id, name, description, creation_date) "
+             "SELECT id, name, description, creation_date FROM source.tasks "
+             "WHERE id IN (SELECT value FROM json_each(?1))",
+    "activity": "INSERT INTO activity (date, task_id, spent_time) "
+                "SELECT date, task_id, spent_time FROM source.activity "
+                "WHERE task_id IN (SELECT value FROM json_each(?1))",
+    # New database already has default tag:
+    "tags": "INSERT OR REPLACE INTO tags (id, name) "
+            "SELECT id, name FROM source.tags WHERE id IN (SELECT tag_id FROM source.tasks_tags "
+            "WHERE task_id IN (SELECT value FROM json_each(?1)))",
+    "tasks_tags": "INSERT INTO tasks_tags (task_id, tag_id) "
+                  "SELECT task_id, tag_id FROM source.tasks_tags "
+                  "WHERE task_id IN (SELECT value FROM json_each(?1))",
+    "timestamps": "INSERT INTO timestamps (timestamp, task_id, event_type, "
+                  "datetime, comment) SELECT timestamp, task_id, event_type, "
+                  "datetime, comment FROM source.timestamps "
+                  "WHERE task_id IN (SELECT value FROM json_each(?1))",
+    "intervals": "INSERT INTO intervals (id, task_id, start, stop) "
+                 "SELECT id, task_id, start, stop FROM source.intervals "
+                 "WHERE task_id IN (SELECT value FROM json_each(?1))",
+    # Copied activity already contains time of compacted intervals:
+    "intervals_compacted": "UPDATE intervals_compacted SET last_id="
+                           "(SELECT last_id FROM source.intervals_compacted) "
+                           "WHERE ?1 IS NOT NULL"
+}
+# Available export formats:
+WRITERS = {}
+register_writer("CSV, task-based", CsvWriter)
+register_writer("CSV, date-based", DatesCsvWriter)
+register_writer("JSON Lines", JsonLinesWriter)
+register_writer("CSV, task-based, gzip", GzipCsvWriter)
+register_writer("CSV, date-based, gzip", GzipDatesCsvWriter)
+register_writer("JSON Lines, gzip", GzipJsonLinesWriter)
+register_writer("SQLite database", SqliteWriter)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+"""Local HTTP server which provides tracker data as JSON. Listens
+on localhost or on a Unix socket:
+    server.py --port 8642
+    server.py --socket /tmp/tracker.sock
+Only GET requests are accepted:
+    /running                    running timers of command line and
+                                of tracker windows, with time spent
+    /tasks?ids=1,2              tasks data: total and today's time
+    /tasks?mode=AND&dates=2024-01-01,2024-01-02&tags=1,2&limit=100
+                                filtered tasks list, as in filter window
+    /timestamps?task=1          timestamps of the task
+    /export?format=JSON Lines&ids=1,2
+                                exported file contents, streamed
+Database is checked and patched on start, then it is only read,
+using connections from the read pool.
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import core
+import export
+
+
+class HttpError(Exception):
+    """Error which is sent to client with given status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def list_param(query, name, convert=str):
+    """Returns list of comma-separated values of query parameter."""
+    values = []
+    for value in query.get(name, ()):
+        values.extend(x for x in value.split(",") if x)
+    try:
+        return [convert(x) for x in values]
+    except ValueError:
+        raise HttpError(400, "Invalid value of parameter: %s" % name)
+
+
+def int_param(query, name, default=None):
+    """Returns integer value of query parameter."""
+    values = list_param(query, name, int)
+    if values:
+        return values[-1]
+    if default is None:
+        raise HttpError(400, "Parameter is required: %s" % name)
+    return default
+
+
+def task_data(task):
+    """Task dictionary of select_tasks() in form used by all responses."""
+    return {"id": task["id"], "name": task["name"],
+            "description": task["descr"],
+            "creation_date": task["creation_date"],
+            "spent_total": task["spent_total"],
+            "spent_today": task["spent_today"]}
+
+
+def running(db, query):
+    """Running timers with time spent on them. Source is "cli" for
+    timers started by start_timer(): their time is saved when they are
+    stopped, so time since the start is added. Source is "window" for
+    timers of tracker windows, which save time every few seconds, so
+    their time is taken from database as it is."""
+    timers = {task_id: (started, "cli")
+              for task_id, started in db.running_timers().items()}
+    timers.update((task_id, (started, "window"))
+                  for task_id, started in db.window_timers().items())
+    tasks = db.select_tasks(timers, cached=False)
+    now = datetime.datetime.now()
+    midnight = datetime.datetime.combine(now.date(), datetime.time())
+    result = []
+    for task_id, (started, source) in timers.items():
+        if task_id not in tasks:
+            continue
+        task = task_data(tasks[task_id])
+        elapsed = (now - started).total_seconds()
+        if source == "cli":
+            task["spent_total"] += elapsed
+            task["spent_today"] += (now - max(started,
+                                              midnight)).total_seconds()
+        task.update({"start_time": started.strftime(
+            core.DATE_STORAGE_TEMPLATE), "elapsed": elapsed,
+            "source": source})
+        result.append(task)
+    return result
+
+
+def tasks(db, query):
+    """Tasks data by ids, or filtered tasks list. Filter has the same
+    semantics as filter window: mode is "AND" or "OR", dates are
+    YYYY-MM-DD strings, tags are tags ids. Without filter all tasks
+    are listed. Filtered list has no spent_today field, and its
+    spent_total is time spent on selected dates in "AND" mode."""
+    if "ids" in query:
+        return [task_data(x) for x in db.select_tasks(
+            list_param(query, "ids", int), cached=False).values()]
+    mode = query.get("mode", ["AND"])[-1]
+    if mode not in ("AND", "OR"):
+        raise HttpError(400, "Mode should be AND or OR")
+    dates = list_param(query, "dates")
+    tags = list_param(query, "tags", int)
+    if dates or tags:
+        script, params = core.prepare_filter_query(dates, tags, mode)
+    else:
+        script, params = core.TASKS_QUERY, ()
+    db.exec_script(script + " ORDER BY tasks.id LIMIT ? OFFSET ?", *params,
+                   int_param(query, "limit", -1),
+                   int_param(query, "offset", 0))
+    return [{"id": row[0], "name": row[1], "description": row[3],
+             "creation_date": row[4], "spent_total": row[2]}
+            for row in db.cur.fetchall()]
+
+
+def timestamps(db, query):
+    """Timestamps of the task, most recent first."""
+    db.exec_script("SELECT timestamp, event_type, datetime, comment "
+                   "FROM timestamps WHERE task_id=? ORDER BY rowid DESC",
+                   int_param(query, "task"))
+    events = {value: key for key, value in core.LOG_EVENTS.items()}
+    return [{"timestamp": row[0], "event": events.get(row[1], row[1]),
+             "datetime": row[2], "comment": row[3]}
+            for row in db.cur.fetchall()]
+
+
+class ApiServer:
+    """Asynchronous HTTP server. Every database request is executed
+    in a thread of the pool with its own read connection, so event loop
+    is never blocked and writer is never waited for."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or core.READ_POOL_SIZE
+        self.executor = ThreadPoolExecutor(self.workers,
+                                           thread_name_prefix="api")
+        self.server = None
+        self.routes = {"/running": running, "/tasks": tasks,
+                       "/timestamps": timestamps}
+
+    async def start(self, host=None, port=None, path=None):
+        """Starts listening on Unix socket if path is given,
+        on host and port otherwise. Port 0 means any free port."""
+        if path:
+            self.server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            self.server = await asyncio.start_server(
+                self.handle, host or HOST, PORT if port is None else port)
+        return self.server
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown()
+
+    def _call(self, function, *args):
+        db = core.Db(readonly=True)
+        try:
+            return function(db, *args)
+        finally:
+            db.close()
+
+    def call(self, function, *args):
+        """Runs function(db, *args) in the thread pool."""
+        return asyncio.get_running_loop().run_in_executor(
+            self.executor, self._call, function, *args)
+
+    async def handle(self, reader, writer):
+        """Serves requests of one connection until it is closed."""
+        try:
+            keep_alive = True
+            while keep_alive:
+                request = await self.read_request(reader)
+                if not request:
+                    break
+                method, target, headers, keep_alive = request
+                try:
+                    if method != "GET":
+                        raise HttpError(405, "Method not allowed")
+                    url = urlsplit(target)
+                    query = parse_qs(url.query)
+                    if url.path == "/export":
+                        await self.send_export(writer, query, keep_alive)
+                        continue
+                    if url.path not in self.routes:
+                        raise HttpError(404, "Not found")
+                    result = await self.call(self.routes[url.path], query)
+                except HttpError as err:
+                    await self.send_json(writer, err.status,
+                                         {"error": str(err)}, keep_alive)
+                except core.DbErrors as err:
+                    await self.send_json(writer, 500, {"error": str(err)},
+                                         keep_alive)
+                else:
+                    await self.send_json(writer, 200, result, keep_alive)
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError,
+                asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """Returns (method, target, headers, keep_alive) tuple,
+        or None if connection is closed by client."""
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise ConnectionError("Malformed request line")
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise ConnectionError("Too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        # Body is not used by any request:
+        length = int(headers.get("content-length", 0) or 0)
+        if length:
+            await reader.readexactly(length)
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+        return method, target, headers, keep_alive
+
+    def _head(self, status, headers, keep_alive):
+        lines = ["HTTP/1.1 %d %s" % (status, STATUSES.get(status, ""))]
+        lines.extend("%s: %s" % item for item in headers)
+        lines.append("Connection: " + ("keep-alive" if keep_alive
+                                       else "close"))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def send_json(self, writer, status, data, keep_alive):
+        body = json.dumps(data).encode("UTF-8")
+        writer.write(self._head(
+            status, (("Content-Type", "application/json"),
+                     ("Content-Length", len(body))), keep_alive) + body)
+        await writer.drain()
+
+    async def send_export(self, writer, query, keep_alive):
+        """Sends export of given tasks in chunked encoding while it is
+        produced in the thread pool. Only text formats can be sent."""
+        name = query.get("format", ["CSV, task-based"])[-1]
+        if name not in export.WRITERS:
+            raise HttpError(404, "Unknown format")
+        exporter = export.WRITERS[name]()
+        if not exporter.media_type:
+            raise HttpError(400, "Format can not be streamed")
+        ids = list_param(query, "ids", int)
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(STREAM_QUEUE_SIZE)
+        cancelled = threading.Event()
+
+        def put(chunk):
+            asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+
+        def produce(db):
+            try:
+                buffer = []
+                size = 0
+                for line in exporter.lines(exporter.rows(db, ids)):
+                    if cancelled.is_set():
+                        return
+                    buffer.append(line)
+                    size += len(line)
+                    if size >= CHUNK_SIZE:
+                        put("".join(buffer).encode("UTF-8"))
+                        buffer = []
+                        size = 0
+                if buffer:
+                    put("".join(buffer).encode("UTF-8"))
+            finally:
+                put(None)
+
+        writer.write(self._head(
+            200, (("Content-Type", exporter.media_type + "; charset=utf-8"),
+                  ("Transfer-Encoding", "chunked")), keep_alive))
+        job = self.call(produce)
+        chunk = b""
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+            # Error after headers are sent can be reported only
+            # by closing connection without the last chunk:
+            await job
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except core.DbErrors:
+            raise ConnectionError("Export failed")
+        finally:
+            cancelled.set()
+            while chunk is not None:
+                chunk = await chunks.get()
+
+
+async def serve(host=None, port=None, path=None, workers=None):
+    """Runs server until it is cancelled."""
+    server = ApiServer(workers)
+    listener = await server.start(host, port, path)
+    print("Serving on", ", ".join(str(x.getsockname())
+                                  for x in listener.sockets))
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time tracker JSON API.")
+    parser.add_argument("--db", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), core.TABLE_FILE),
+        help="database file")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--socket", help="Unix socket path to listen on "
+                                         "instead of host and port")
+    parser.add_argument("--workers", type=int, default=core.READ_POOL_SIZE,
+                        help="number of database read connections")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        sys.exit("Database not found: %s" % args.db)
+    core.TABLE_FILE = args.db
+    core.READ_POOL_SIZE = args.workers
+    try:
+        # Schema of older versions is patched before requests are served:
+        core.check_database()
+    except (core.DbErrors, sqlite3.DatabaseError) as err:
+        core.close_connections()
+        sys.exit("Database can not be used: %s" % err)
+    try:
+        asyncio.run(serve(args.host, args.port, args.socket, args.workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.close_connections()
+
+
+HOST = "127.0.0.1"
+PORT = 8642
+# Seconds to wait for the next request on open connection:
+IDLE_TIMEOUT = 60
+MAX_HEADERS = 100
+# Size of export data sent at once, in characters, and number
+# of chunks prepared in advance:
+CHUNK_SIZE = 65536
+STREAM_QUEUE_SIZE = 4
+STATUSES = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+if __name__ == "__main__":
+    main()
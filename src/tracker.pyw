@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
-import copy
+import time
+# Start of the program, used for measuring of startup time:
+START_TIME = time.perf_counter()
+
 import datetime
+import logging
 import os
-import time
 from collections import OrderedDict
 from contextlib import suppress
 
@@ -14,21 +17,23 @@ except ModuleNotFoundError:
          "https://docs.python.org/3/library/tkinter.html.")
 
 from tkinter.filedialog import asksaveasfilename
-from tkinter.messagebox import askyesno, showinfo
+from tkinter.messagebox import askyesno, showinfo, showwarning
 from tkinter import ttk
 from tkinter import TclError
 
 import core
 import elements
-import sel_cal
+import export
 
 
 class Window(tk.Toplevel):
     """Universal class for dialogue windows creation."""
+    # Windows which only read from database use pooled read connections:
+    db_readonly = False
 
     def __init__(self, master=None, **options):
         super().__init__(master=master, **options)
-        self.db = core.Db()
+        self.db = core.Db(readonly=self.db_readonly)
         self.master = master
         self.bind("<Escape>", lambda e: self.destroy())
 
@@ -70,7 +75,7 @@ class Window(tk.Toplevel):
         self.lift()
 
     def destroy(self):
-        self.db.con.close()
+        self.db.close()
         if self.master:
             self.master.focus_set()
             self.master.lift()
@@ -192,6 +197,8 @@ class TaskFrame(tk.Frame):
         self.clear_button.grid(row=3, column=5, sticky='e', padx=5)
         self.running = False
         self.paused = False
+        # Text currently displayed by timer label:
+        self.indicator_text = None
 
     def normal_interface(self):
         """Creates elements which are visible only in full interface mode."""
@@ -308,16 +315,21 @@ class TaskFrame(tk.Frame):
                 if self.task["id"] != task_id:
                     showinfo(*message)
 
-    def get_restored_task_name(self, taskid):
-        # Preparing new task:
-        self.set_task_data(taskid)
-        self.prepare_task()
+    def get_restored_task_name(self, taskid, task=None):
+        """Preparing new task. Task data can be given if it has been
+        already loaded from database, e.g. on program start."""
+        if task:
+            self.task = task
+            self.prepare_task(save=False)
+        else:
+            self.set_task_data(taskid)
+            self.prepare_task()
 
     def set_task_data(self, taskid):
         """Get task data from database"""
         self.task = self.db.select_task(taskid) # Task parameters from database
 
-    def prepare_task(self):
+    def prepare_task(self, save=True):
         """Prepares frame elements to work with."""
         self.current_date = core.today()
         # Adding task id and state to dictionary of running tasks:
@@ -335,7 +347,7 @@ class TaskFrame(tk.Frame):
         self.timestamps_window_button.config(state='normal')
         if hasattr(self, "description_area"):
             self.description_area.update_text(self.task["descr"])
-        if GLOBAL_OPTIONS["preserve_tasks"]:
+        if save and GLOBAL_OPTIONS["preserve_tasks"]:
             self.db.update_preserved_tasks(GLOBAL_OPTIONS["tasks"])
 
     def configure_indicator(self):
@@ -345,36 +357,41 @@ class TaskFrame(tk.Frame):
                 spent = self.task["spent_today"]
             else:
                 spent = self.task["spent_total"]
-            self.timer_label.config(text=core.time_format(spent))
+            text = core.time_format(spent)
+            # Label is reconfigured only when displayed text changes:
+            if text != self.indicator_text:
+                self.timer_label.config(text=text)
+                self.indicator_text = text
 
     def task_update(self):
-        """Updates time in the database."""
-        res = self.db.update_task(self.task["id"],
-                                  value=self.task["spent_today"],
-                                  prev_date=self.current_date)
+        """Queues time spent since previous saving for adding
+        to the database by background persister."""
+        res = core.time_persister().save(
+            self.task["id"], delta=self.task["spent_today"] - self.saved_today,
+            prev_date=self.current_date)
         if res:
             self.current_date = res.current_date
+            # Moving start point, so counting continues from new value:
+            self.start_today += res.remained - self.task["spent_today"]
             self.task["spent_today"] = res.remained
-
-    def timer_update(self, counter=0):
-        """Renewal of the counter."""
-        spent = time.time() - self.start_time
-        self.task["spent_today"] += spent
-        self.task["spent_total"] += spent
-        self.start_time = time.time()
+        self.saved_today = self.task["spent_today"]
+
+    def timer_update(self, now=None):
+        """Renewal of the counter. Called by MainFrame ticker.
+        Spent time is calculated from monotonic start point."""
+        elapsed = (now or time.monotonic()) - self.start_time
+        self.task["spent_today"] = self.start_today + elapsed
+        self.task["spent_total"] = self.start_total + elapsed
         self.configure_indicator()
-        # Every n seconds counter value is saved in database:
-        if counter >= GLOBAL_OPTIONS["SAVE_INTERVAL"]:
-            self.task_update()
-            counter = 0
-        else:
-            counter += GLOBAL_OPTIONS["TIMER_INTERVAL"]
-        # self.timer variable becomes ID created by after():
-        self.timer = self.timer_label.after(
-            GLOBAL_OPTIONS["TIMER_INTERVAL"], self.timer_update, counter)
 
     def timer_start(self, log=True, stop_all=True):
         """Counter start."""
+        if not self.running and self.task["id"] in self.db.running_timers():
+            # Time would be counted by both timers:
+            showwarning("Task is running",
+                        "Task is started from command line. "
+                        "Stop it there before starting it here.")
+            return
         if not self.running:
             self.start_button.config(
                 image=os.curdir + '/resource/stop.png' if tk.TkVersion >= 8.6
@@ -397,13 +414,19 @@ class TaskFrame(tk.Frame):
             self.current_date = core.today()
             self.set_task_data(self.task["id"])
             self.configure_indicator()
-            # Setting current timestamp:
-            self.start_time = time.time()
+            # Setting start point for counting:
+            self.start_time = time.monotonic()
+            self.start_today = self.task["spent_today"]
+            self.start_total = self.task["spent_total"]
+            # Only time spent after this value is saved:
+            self.saved_today = self.start_today
+            # Running timer is visible to other programs:
+            self.db.start_window_timer(self.task["id"])
             self.running = True
             self.paused = False
             if not get_paused_taskframes():
                 ROOT_WINDOW.change_paused_state()
-            self.timer_update()
+            ROOT_WINDOW.taskframes.start_ticker()
 
     def timer_stop(self, log=True, log_message=None, paused=False):
         """Stop counter and save its value to database."""
@@ -413,12 +436,14 @@ class TaskFrame(tk.Frame):
             if log:
                 self.add_timestamp(event_id, comment)
         if self.running:
-            # after_cancel() stops execution of callback with given ID.
-            self.timer_label.after_cancel(self.timer)
+            # Counting time up to this moment:
+            self.timer_update()
             self.running = False
             GLOBAL_OPTIONS["tasks"][self.task["id"]] = False
             # Writing value into database:
             self.task_update()
+            core.time_persister().flush()
+            self.db.stop_window_timer(self.task["id"])
             self.update_description()
             if paused:
                 event_id = core.LOG_EVENTS["PAUSE"]
@@ -448,7 +473,7 @@ class TaskFrame(tk.Frame):
             self.add_timestamp(core.LOG_EVENTS["STOP"], message)
         if self.task:
             GLOBAL_OPTIONS["tasks"].pop(self.task["id"])
-        self.db.con.close()
+        self.db.close()
         tk.Frame.destroy(self)
 
 
@@ -496,10 +521,10 @@ class Table(tk.Frame):
         style = ttk.Style()
         style.configure(".", font=('Helvetica', elements.FONTSIZE + 1))
         style.configure("Treeview.Heading", font=('Helvetica', elements.FONTSIZE + 1))
-        scroller = tk.Scrollbar(self)
-        scroller.config(command=self.table.yview)
-        self.table.config(yscrollcommand=scroller.set)
-        scroller.pack(side='right', fill='y')
+        self.scroller = tk.Scrollbar(self)
+        self.scroller.config(command=self.table.yview)
+        self.table.config(yscrollcommand=self.scroller.set)
+        self.scroller.pack(side='right', fill='y')
         self.table.pack(fill='both', expand=1)
         # Creating and naming columns:
         self.table.config(columns=tuple([key for key in columns]))
@@ -514,14 +539,6 @@ class Table(tk.Frame):
         self.table.column('#0', anchor='w', width=70, minwidth=50,
                           stretch=0)
 
-    def _sort(self, position, reverse):
-        l = []
-        for index, task in enumerate(self.table.get_children()):
-            l.append((self.data[index][position], task))
-        # Sort tasks list by corresponding field to match current sorting:
-        self.data.sort(key=lambda x: x[position], reverse=reverse)
-        return l
-
     def sort_table_contents(self, col, reverse):
         """Should be redefined by successors."""
         pass
@@ -533,17 +550,9 @@ class Table(tk.Frame):
         self.table.focus_set()
         self.table.focus(item)
 
-    def update_data(self, data):
-        """Update contents of internal data used to fill the table."""
-        for item in self.table.get_children():
-            self.table.delete(item)
-        self.data = copy.deepcopy(data)
-
-    def insert_rows(self, data):
-        """Insert rows in the table. Row contents
-        are tuples provided by 'values='."""
-        for i, v in enumerate(data):  # item, number, value:
-            self.table.insert('', i, text="#%d" % (i + 1), values=v)
+    def delete_items(self, items):
+        """Remove rows with given item ids."""
+        self.table.delete(*items)
 
     def select_all(self):
         self.table.selection_set(
@@ -555,48 +564,361 @@ class Table(tk.Frame):
 
 
 class TaskTable(Table):
-    """Scrollable tasks table."""
+    """Scrollable tasks table. Only rows which fit into visible area
+    exist in the Treeview: they are refilled from the model on scroll.
+    Model rows are fetched from database cursor page by page
+    when they are needed. Rows are tuples:
+    (id, name, spent_time, description, creation_date)."""
+
+    # Number of rows fetched from database at once:
+    page_size = 500
+    # Positions of fields in model rows:
+    ID, NAME, SPENT_TIME, DESCR, CREATION_DATE = range(5)
+    # Database fields used for sorting by columns:
+    SORT_FIELDS = {"taskname": "name", "spent_time": "total_time",
+                   "creation_date": "creation_date"}
 
     def __init__(self, columns, parent=None, **options):
         super().__init__(columns, parent=parent, **options)
         self.table.column('taskname', width=600, anchor='w')
+        self.rows = []
+        # Positions of rows in the model by task id:
+        self.positions = {}
+        # Cached orders of task ids by (column, reverse):
+        self.orders = {}
+        # Cursor with rows which are not fetched yet. It belongs
+        # to the table and is closed when all rows are fetched:
+        self.source = None
+        # Number of rows in whole result:
+        self.count = 0
+        # Position of the first displayed row:
+        self.offset = 0
+        # Ids of selected and focused tasks:
+        self.selected = set()
+        self.focused = None
+        # Treeview items and ids of tasks displayed in them:
+        self.items = []
+        self.rendered = {}
+        # Text and values displayed in every item, selected items
+        # and focused item. Treeview is changed only where they differ:
+        self.shown = {}
+        self.shown_selection = ()
+        self.shown_focus = None
+        self.row_height = tk.font.Font(
+            font=('Helvetica', elements.FONTSIZE + 1)).metrics('linespace')
+        self.header_height = self.row_height
+        self.replace_selection = False
+        # Scrolling is performed by the model instead of Treeview:
+        self.scroller.config(command=self.yview)
+        self.table.config(yscrollcommand='')
+        self.table.bind("<Configure>", lambda e: self.render())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.table.bind(sequence, self.mouse_scroll)
+        self.table.bind("<ButtonPress-1>", self.click)
+        self.table.bind("<<TreeviewSelect>>", self.sync_selection)
+        self.table.bind("<Up>", lambda e: self.move_focus(-1))
+        self.table.bind("<Down>", lambda e: self.move_focus(1))
+        self.table.bind("<Prior>", lambda e: self.move_focus(
+            -self.visible_rows()))
+        self.table.bind("<Next>", lambda e: self.move_focus(
+            self.visible_rows()))
+
+    def load(self, db, query, count, params=(), rows=None):
+        """Set new source of rows: query which will be executed with
+        given parameters using given Db instance. Count is an expected
+        number of rows. If all rows are given, query is not executed.
+        If query is the same as before, table is refreshed: scroll
+        position, selection and focus are kept for remaining tasks."""
+        refresh = (getattr(self, "query", None), getattr(
+            self, "params", None)) == (query, params)
+        selected, focused, offset = self.selected, self.focused, self.offset
+        self.close_source()
+        self.db = db
+        self.query = query
+        self.params = params
+        if rows is None:
+            self.source = self.db.open_cursor(query, *params)
+            self.rows = []
+            self.positions = {}
+        else:
+            self.rows = list(rows)
+            self.positions = {x[self.ID]: n for n, x in enumerate(self.rows)}
+            self.source = None
+        self.orders = {}
+        self.count = count
+        self.offset = 0
+        self.selected = set()
+        self.focused = None
+        if refresh:
+            self.fetch(offset + self.visible_rows())
+            self.offset = offset
+            self.selected = {x for x in selected if x in self.positions}
+            if focused in self.positions:
+                self.focused = focused
+        self.render()
+
+    def add_row(self, row):
+        """Adds row after rows which are fetched so far. Rows which
+        are not fetched yet follow it, so nothing is read from
+        database."""
+        self.positions[row[self.ID]] = len(self.rows)
+        self.rows.append(row)
+        self.count += 1
+        self.orders = {}
+        self.render()
+
+    def fetch(self, number):
+        """Fetch rows from database until there are at least
+        given number of rows in the model."""
+        while self.source is not None and len(self.rows) < number:
+            page = self.source.fetchmany(self.page_size)
+            if not page:
+                self.close_source()
+                self.count = len(self.rows)
+                break
+            for row in page:
+                # Row could be added by add_row() before it is fetched:
+                if row[self.ID] in self.positions:
+                    continue
+                self.positions[row[self.ID]] = len(self.rows)
+                self.rows.append(row)
+        self.count = max(self.count, len(self.rows))
+
+    def load_all(self):
+        """Fetch all rows which are left in the source."""
+        self.fetch(float('inf'))
+
+    def close_source(self):
+        """Close cursor of the source, so it does not keep
+        database snapshot open."""
+        if self.source is not None:
+            self.db.close_cursor(self.source)
+            self.source = None
 
-    def sort_table_contents(self, col, reverse):
-        """Sorting by click on column header."""
-        if col == "spent_time":
-            shortlist = self._sort(1, reverse)
-        elif col == "creation_date":
-            shortlist = self._sort(2, reverse)
+    def destroy(self):
+        self.close_source()
+        super().destroy()
+
+    def row(self, task_id):
+        """Returns model row for given task id."""
+        return self.rows[self.positions[task_id]]
+
+    def set_row(self, task_id, **fields):
+        """Changes fields of model row for given task id.
+        Field names are lowercase names of row positions."""
+        row = list(self.row(task_id))
+        for key, value in fields.items():
+            row[getattr(self, key.upper())] = value
+        self.rows[self.positions[task_id]] = tuple(row)
+        self.render()
+
+    def remove(self, ids):
+        """Removes rows with given task ids from the model."""
+        ids = set(ids)
+        self.rows = [x for x in self.rows if x[self.ID] not in ids]
+        self.positions = {x[self.ID]: n for n, x in enumerate(self.rows)}
+        self.count -= len(ids)
+        self.selected -= ids
+        if self.focused in ids:
+            self.focused = None
+        self.render()
+
+    def find(self, ids):
+        """Returns those of given task ids which are present in the table,
+        keeping their order. Rows are fetched up to the last of them."""
+        if self.source is not None and ids:
+            # Cursor of the source should not be interrupted:
+            cursor = self.db.con.cursor()
+            cursor.execute('SELECT id FROM ({0}) WHERE id IN ({1})'.format(
+                self.query, ",".join(map(str, ids))), self.params)
+            members = {x[0] for x in cursor.fetchall()}
+            cursor.close()
+            while self.source is not None \
+                    and not members <= self.positions.keys():
+                self.fetch(len(self.rows) + self.page_size)
+        return [x for x in ids if x in self.positions]
+
+    def ids(self):
+        """Returns ids of all tasks in the table."""
+        self.load_all()
+        return [x[self.ID] for x in self.rows]
+
+    def selection(self):
+        """Returns ids of selected tasks in table order."""
+        return sorted(self.selected, key=self.positions.get)
+
+    def visible_rows(self):
+        """Number of rows which fit into the table."""
+        if self.items:
+            box = self.table.bbox(self.items[0])
+            if box:
+                self.header_height, self.row_height = box[1], box[3]
+        return max(1, (self.table.winfo_height() - self.header_height)
+                   // self.row_height)
+
+    def format_row(self, row):
+        """Values of Treeview item for model row."""
+        return (row[self.NAME], core.time_format(row[self.SPENT_TIME]),
+                core.table_date_format(row[self.CREATION_DATE]))
+
+    def render(self):
+        """Refill Treeview items with model rows starting from offset."""
+        visible = self.visible_rows()
+        self.fetch(self.offset + visible)
+        self.offset = max(0, min(self.offset, self.count - visible))
+        rows = self.rows[self.offset:self.offset + visible]
+        while len(self.items) < len(rows):
+            self.items.append(self.table.insert('', 'end'))
+        while len(self.items) > len(rows):
+            item = self.items.pop()
+            self.table.delete(item)
+            self.shown.pop(item, None)
+        self.rendered = {}
+        selection = []
+        focus = None
+        for number, (item, row) in enumerate(zip(self.items, rows),
+                                             self.offset + 1):
+            shown = ("#%d" % number, self.format_row(row))
+            if self.shown.get(item) != shown:
+                self.table.item(item, text=shown[0], values=shown[1])
+                self.shown[item] = shown
+            self.rendered[item] = row[self.ID]
+            if row[self.ID] in self.selected:
+                selection.append(item)
+            if row[self.ID] == self.focused:
+                focus = item
+        if focus is not None and focus != self.shown_focus:
+            self.table.focus(focus)
+        self.shown_focus = focus
+        if tuple(selection) != self.shown_selection:
+            self.table.selection_set(selection)
+            self.shown_selection = tuple(selection)
+        if self.count:
+            self.scroller.set(self.offset / self.count,
+                              (self.offset + len(rows)) / self.count)
         else:
-            shortlist = self._sort(0, reverse)
-        shortlist.sort(key=lambda x: x[0], reverse=reverse)
-        for index, value in enumerate(shortlist):
-            self.table.move(value[1], '', index)
+            self.scroller.set(0, 1)
+
+    def yview(self, *args):
+        """Scrollbar command."""
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * self.count)
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self.visible_rows()
+            self.offset += step
+        self.render()
+
+    def mouse_scroll(self, event):
+        if event.num == 4 or event.delta > 0:
+            delta = -1
+        else:
+            delta = 1
+        self.yview('scroll', delta * 3, 'units')
+        return "break"
+
+    def click(self, event):
+        """Focuses on clicked row. Click without modifiers replaces
+        whole selection, including rows which are not displayed."""
+        self.replace_selection = not event.state & 0x0005  # Shift, Control.
+        task_id = self.rendered.get(self.table.identify_row(event.y))
+        if task_id is not None and task_id != self.focused:
+            self.focused = task_id
+            self.event_generate("<<TaskFocused>>")
+
+    def sync_selection(self, event=None):
+        """Copy selection of displayed rows from Treeview to the model."""
+        self.shown_selection = self.table.selection()
+        current = {self.rendered[x] for x in self.shown_selection
+                   if x in self.rendered}
+        if self.replace_selection:
+            self.selected = current
+            self.replace_selection = False
+        else:
+            self.selected = (self.selected - set(
+                self.rendered.values())) | current
+
+    def focus_task(self, task_id, selection=None, take_focus=True):
+        """Scrolls to the row with given task id and focuses on it.
+        Selects given task ids or only focused task."""
+        position = self.positions[task_id]
+        visible = self.visible_rows()
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + visible:
+            self.offset = position - visible + 1
+        self.selected = set(selection) if selection else {task_id}
+        self.focused = task_id
+        self.render()
+        if take_focus:
+            self.table.focus_set()
+        self.event_generate("<<TaskFocused>>")
+
+    def move_focus(self, step):
+        """Moves focus by given number of rows."""
+        if self.count:
+            if self.focused in self.positions:
+                position = self.positions[self.focused] + step
+            else:
+                position = self.offset
+            self.fetch(position + 1)
+            position = max(0, min(position, self.count - 1))
+            self.focus_task(self.rows[position][self.ID])
+        return "break"
+
+    def select_all(self):
+        self.load_all()
+        self.selected = set(self.positions)
+        self.render()
+
+    def clear_all(self):
+        self.selected = set()
+        self.render()
+
+    def _sort(self, col, reverse):
+        """Returns task ids ordered by given column. Order is calculated
+        by database once for every column and direction,
+        then taken from cache."""
+        key = (col, reverse)
+        if key not in self.orders:
+            if (col, not reverse) in self.orders:
+                self.orders[key] = self.orders[(col, not reverse)][::-1]
+            else:
+                self.db.exec_script(
+                    'SELECT id FROM ({0}) ORDER BY {1} {2}, id {2}'.format(
+                        self.query, self.SORT_FIELDS[col],
+                        'DESC' if reverse else 'ASC'), *self.params)
+                self.orders[key] = [x[0] for x in self.db.cur.fetchall()]
+        return self.orders[key]
+
+    def sort_table_contents(self, col, reverse):
+        """Sorting by click on column header. Only visible rows
+        are redrawn."""
+        # Order contains all rows, so they should be in the model:
+        self.load_all()
+        self.rows = [self.rows[self.positions[x]]
+                     for x in self._sort(col, reverse) if x in self.positions]
+        self.positions = {x[self.ID]: n for n, x in enumerate(self.rows)}
+        self.render()
         self.table.heading(col, command=lambda:
                                     self.sort_table_contents(col, not reverse))
 
-    def update_tasks_list(self, data):
-        """Refill table contents."""
-        self.update_data(data)
-        for t in data:
-            t[1] = core.time_format(t[1])
-            t[2] = core.table_date_format(t[2])
-        self.insert_rows(data)
-
 
 class TaskSelectionWindow(Window):
     """Task selection and creation window."""
+    # Pause in typing after which search starts, ms:
+    search_delay = 300
 
     def __init__(self, parent=None, taskvar=None, **options):
         super().__init__(master=parent, **options)
         # Variable which will contain selected task id:
         if taskvar:
             self.task_id_var = taskvar
+        # ID of scheduled search, created by after():
+        self.search_job = None
         # Basic script for retrieving tasks from database:
-        self.main_script = 'SELECT id, name, total_time, description, ' \
-                           'creation_date FROM tasks JOIN (SELECT task_id, ' \
-                           'sum(spent_time) AS total_time FROM activity ' \
-                           'GROUP BY task_id) AS act ON act.task_id=tasks.id'
+        self.main_script = core.TASKS_QUERY
         self.title("Task selection")
         self.minsize(width=500, height=350)
         elements.SimpleLabel(self, text="New task:").grid(row=0, column=0,
@@ -700,33 +1022,15 @@ class TaskSelectionWindow(Window):
         tk.Frame(self, height=40).grid(row=5, columnspan=5, sticky='news')
         self.grid_columnconfigure(2, weight=1, minsize=50)
         self.grid_rowconfigure(2, weight=1, minsize=50)
+        # Separate read connection keeps cursor with not fetched rows:
+        self.list_db = core.Db(readonly=True)
         self.update_table()  # Fill table contents.
-        self.current_task = ''  # Current selected task.
-        self.table_frame.table.bind("<Down>", self.descr_down)
-        self.table_frame.table.bind("<Up>", self.descr_up)
-        self.table_frame.table.bind("<Button-1>", self.descr_click)
+        self.table_frame.bind("<<TaskFocused>>", lambda e: self.update_descr(
+            self.table_frame.focused))
         self.table_frame.bind("<FocusIn>",
                               lambda e: self.focus_first_item(forced=False))
-        # Need to avoid masquerading of default ttk.Treeview action
-        # on Shift+click and Control+click:
-        self.modifier_pressed = False
-        self.table_frame.table.bind("<KeyPress-Shift_L>",
-                                    lambda e: self.shift_control_pressed())
-        self.table_frame.table.bind("<KeyPress-Shift_R>",
-                                    lambda e: self.shift_control_pressed())
-        self.table_frame.table.bind("<KeyPress-Control_L>",
-                                    lambda e: self.shift_control_pressed())
-        self.table_frame.table.bind("<KeyPress-Control_R>",
-                                    lambda e: self.shift_control_pressed())
-        self.table_frame.table.bind("<KeyRelease-Shift_L>",
-                                    lambda e: self.shift_control_released())
-        self.table_frame.table.bind("<KeyRelease-Shift_R>",
-                                    lambda e: self.shift_control_released())
-        self.table_frame.table.bind("<KeyRelease-Control_L>",
-                                    lambda e: self.shift_control_released())
-        self.table_frame.table.bind("<KeyRelease-Control_R>",
-                                    lambda e: self.shift_control_released())
         self.search_entry.bind("<Return>", lambda e: self.locate_task())
+        self.search_entry.bind("<KeyRelease>", self.search_typed)
         self.bind("<F5>", lambda e: self.update_table())
         elements.TaskButton(self, text="Open", command=self.get_task).grid(
             row=6, column=0, padx=5, pady=5, sticky='w')
@@ -746,10 +1050,13 @@ class TaskSelectionWindow(Window):
 
     def get_task(self):
         """Get selected task id from database and close window."""
-        # List of selected tasks item id's:
-        tasks = self.table_frame.table.selection()
+        # List of selected tasks id's:
+        tasks = self.table_frame.selection()
         if tasks:
-            self.task_id_var.set(self.tdict[tasks[0]]["id"])
+            if self.table_frame.focused in tasks:
+                self.task_id_var.set(self.table_frame.focused)
+            else:
+                self.task_id_var.set(tasks[0])
             self.destroy()
 
     def get_task_id(self, event):
@@ -757,65 +1064,51 @@ class TaskSelectionWindow(Window):
         if self.check_row(event):
             self.get_task()
 
-    def shift_control_pressed(self):
-        self.modifier_pressed = True
-
-    def shift_control_released(self):
-        self.modifier_pressed = False
-
     def focus_first_item(self, forced=True):
         """Selects first item in the table if no items selected."""
-        if self.table_frame.table.get_children():
-            item = self.table_frame.table.get_children()[0]
-        else:
+        if not self.table_frame.count:
             return
-        if forced:
-            self.table_frame.focus_(item)
-            self.update_descr(item)
+        if forced or not self.table_frame.selected:
+            self.table_frame.focus_task(self.table_frame.rows[0][0])
         else:
-            if not self.table_frame.table.selection():
-                self.table_frame.focus_(item)
-                self.update_descr(item)
-            else:
-                self.table_frame.table.focus_set()
-
-    def locate_task(self):
-        """Search task by keywords."""
+            self.table_frame.table.focus_set()
+
+    def search_typed(self, event):
+        """Search-as-you-type: search starts when typing pauses."""
+        if event.keysym != 'Return':
+            if self.search_job:
+                self.after_cancel(self.search_job)
+            self.search_job = self.after(self.search_delay,
+                                         lambda: self.locate_task(True))
+
+    def locate_task(self, typing=False):
+        """Search task by keywords among tasks of the list.
+        While typing, found tasks are selected without moving focus
+        and without messages."""
+        self.search_job = None
         searchword = self.search_entry.get()
         if searchword:
-            self.table_frame.clear_all()
-            task_items = []
-            if self.ignore_case_var.get():
-                for key in self.tdict:
-                    if searchword.lower() in self.tdict[key]["name"].lower():
-                        task_items.append(key)
-                    # Need to be sure that there is non-empty description:
-                    elif self.tdict[key]["descr"]:
-                        if searchword.lower() in self.tdict[key]["descr"].lower():
-                            task_items.append(key)
-            else:
-                for key in self.tdict:
-                    if searchword in self.tdict[key]["name"]:
-                        task_items.append(key)
-                    elif self.tdict[key]["descr"]:
-                        if searchword in self.tdict[key]["descr"]:
-                            task_items.append(key)
+            ignore_case = self.ignore_case_var.get()
+            found = self.list_db.search_tasks(
+                searchword, within=self.table_frame.query,
+                params=self.table_frame.params, ignore_case=ignore_case)
+            task_items = self.table_frame.find(found)
             if task_items:
-                for item in task_items:
-                    self.table_frame.table.selection_add(item)
-                item = self.table_frame.table.selection()[0]
-                self.table_frame.table.see(item)
-                self.table_frame.table.focus_set()
-                self.table_frame.table.focus(item)
-                self.update_descr(item)
-            else:
-                showinfo("No results",
-                         "No tasks found."
-                         "\nMaybe need to change filter settings?")
+                self.table_frame.focus_task(task_items[0], task_items,
+                                            take_focus=not typing)
+            elif not typing:
+                self.table_frame.clear_all()
+                if self.list_db.search_tasks(searchword, limit=1,
+                                             ignore_case=ignore_case):
+                    showinfo("No results",
+                             "Found tasks are not in the list."
+                             "\nMaybe need to change filter settings?")
+                else:
+                    showinfo("No results", "No tasks found.")
 
     def export(self):
         """Export all tasks from the table into the file."""
-        ExportWindow(self, self.tdict)
+        ExportWindow(self, self.table_frame.ids())
 
     def add_new_task(self):
         """Adds new task into the database."""
@@ -824,130 +1117,94 @@ class TaskSelectionWindow(Window):
             for x in ('"', "'", "`"):
                 task_name = task_name.replace(x, '')
             try:
-                self.db.insert_task(task_name)
+                task_id = self.db.insert_task(task_name)
             except core.DbErrors:
                 self.db.reconnect()
-                for item in self.tdict:
-                    if self.tdict[item]["name"] == task_name:
-                        self.table_frame.focus_(item)
-                        self.update_descr(item)
-                        break
+                self.db.exec_script("SELECT id FROM tasks WHERE name=?",
+                                    task_name)
+                found = self.table_frame.find(
+                    [x[0] for x in self.db.cur.fetchall()])
+                if found:
+                    self.table_frame.focus_task(found[0])
                 else:
                     showinfo("Task exists",
                              "Task already exists. "
                              "Change filter configuration to see it.")
             else:
-                self.update_table()
-                # If created task appears in the table, highlight it:
-                for item in self.tdict:
-                    if self.tdict[item]["name"] == task_name:
-                        self.table_frame.focus_(item)
-                        break
+                # If created task passes the filter, it is added
+                # to the table without reloading and highlighted:
+                self.db.exec_script(
+                    "SELECT * FROM ({0}) WHERE id=?".format(
+                        self.table_frame.query),
+                    *self.table_frame.params, task_id)
+                row = self.db.cur.fetchone()
+                if row:
+                    self.table_frame.add_row(row)
+                    self.table_frame.focus_task(task_id)
                 else:
                     showinfo("Task created",
                              "Task successfully created. "
                              "Change filter configuration to see it.")
 
-    def filter_query(self):
-        return self.db.find_by_clause(table='options', field='name',
-                                      value='filter', searchfield='value')[0][0]
-
     def update_table(self):
         """Updating table contents using database query."""
         # Restoring filter value:
-        query = self.filter_query()
-        if query:
+        if self.db.load_filter():
             self.filter_button.config(bg='lightblue')
-            self.db.exec_script(query)
         else:
             self.filter_button.config(bg=GLOBAL_OPTIONS["colour"])
-            self.db.exec_script(self.main_script)
-        tlist = [{"id": task[0], "name": task[1], "spent_time": task[2],
-                  "descr": task[3], "creation_date": task[4]}
-                 for task in self.db.cur.fetchall()]
-        self.table_frame.update_tasks_list(
-            [[f["name"], f["spent_time"], f["creation_date"]] for f in tlist])
-        # Dictionary with row ids and tasks info:
-        self.tdict = {}
-        for n, task_id in enumerate(self.table_frame.table.get_children()):
-            self.tdict[task_id] = tlist[n]
+        # Open cursor of previous list would keep old snapshot
+        # of database for the new query:
+        self.table_frame.close_source()
+        query, params = self.list_db.filter_query()
+        # Result is taken from cache if database has not been changed.
+        # Rows of large lists are fetched by the table when they are needed:
+        count, fulltime, rows = self.list_db.tasks_list(query, params)
+        self.table_frame.load(self.list_db, query, count, params, rows)
+        self.fulltime = fulltime
         self.update_descr(None)
         self.update_fulltime()
 
     def update_fulltime(self):
         """Updates value in "fulltime" frame."""
-        self.fulltime = core.time_format(
-            sum([self.tdict[x]["spent_time"] for x in self.tdict]))
-        self.fulltime_frame.config(text=self.fulltime)
-
-    def descr_click(self, event):
-        """Updates description for the task with item id of the row
-        selected by click."""
-        pos = self.table_frame.table.identify_row(event.y)
-        if pos and pos != '#0' and not self.modifier_pressed:
-            self.table_frame.focus_(pos)
-        self.update_descr(self.table_frame.table.focus())
-
-    def descr_up(self, event):
-        """Updates description for the item id which is BEFORE selected."""
-        item = self.table_frame.table.focus()
-        prev_item = self.table_frame.table.prev(item)
-        if prev_item == '':
-            self.update_descr(item)
-        else:
-            self.update_descr(prev_item)
-
-    def descr_down(self, event):
-        """Updates description for the item id which is AFTER selected."""
-        item = self.table_frame.table.focus()
-        next_item = self.table_frame.table.next(item)
-        if next_item == '':
-            self.update_descr(item)
-        else:
-            self.update_descr(next_item)
+        self.fulltime_frame.config(text=core.time_format(self.fulltime))
 
-    def update_descr(self, item):
+    def update_descr(self, task_id):
         """Filling task description frame."""
-        if item is None:
+        if task_id is None:
             self.description_area.update_text('')
-        elif item != '':
-            self.description_area.update_text(self.tdict[item]["descr"])
+        else:
+            self.description_area.update_text(
+                self.table_frame.row(task_id)[3])
 
     def delete(self):
         """Remove selected tasks from the database and the table."""
-        ids = [self.tdict[x]["id"] for x in self.table_frame.table.selection()
-               if self.tdict[x]["id"] not in GLOBAL_OPTIONS["tasks"]]
-        items = [x for x in self.table_frame.table.selection() if
-                 self.tdict[x]["id"] in ids]
+        ids = [x for x in self.table_frame.selection()
+               if x not in GLOBAL_OPTIONS["tasks"]]
         if ids:
             answer = askyesno("Warning",
                               "Are you sure you want to delete selected tasks?",
                               parent=self)
             if answer:
                 self.db.delete_tasks(tuple(ids))
-                self.table_frame.table.delete(*items)
-                for item in items:
-                    self.tdict.pop(item)
+                self.fulltime -= sum(self.table_frame.row(x)[2] for x in ids)
+                self.table_frame.remove(ids)
                 self.update_descr(None)
                 self.update_fulltime()
 
     def edit(self):
         """Show task edit window."""
-        item = self.table_frame.table.focus()
-        try:
-            id_name = {"id": self.tdict[item]["id"],
-                       "name": self.tdict[item]["name"]}
-        except KeyError:
-            pass
-        else:
+        task_id = self.table_frame.focused
+        if task_id is not None:
             task_changed = tk.IntVar()
-            TaskEditWindow(id_name["id"], self, variable=task_changed)
+            TaskEditWindow(task_id, self, variable=task_changed)
             if task_changed.get() == 1:
                 # Reload task information from database:
-                new_task_info = self.db.select_task(id_name["id"])
+                new_task_info = self.db.select_task(task_id)
                 # Update description:
-                self.tdict[item]["descr"] = new_task_info["descr"]
-                self.update_descr(item)
+                self.table_frame.set_row(task_id,
+                                         descr=new_task_info["descr"])
+                self.update_descr(task_id)
         self.raise_window()
 
     def filterwindow(self):
@@ -957,27 +1214,24 @@ class TaskSelectionWindow(Window):
         # Update tasks list only if filter parameters have been changed:
         if filter_changed.get() == 1:
             self.apply_filter(GLOBAL_OPTIONS["filter_dict"]['operating_mode'],
-                              GLOBAL_OPTIONS["filter_dict"]['script'],
                               GLOBAL_OPTIONS["filter_dict"]['tags'],
                               GLOBAL_OPTIONS["filter_dict"]['dates'])
         self.raise_window()
 
-    def apply_filter(self, operating_mode='AND', script=None, tags='',
-                     dates=''):
+    def apply_filter(self, operating_mode='AND', tags=(), dates=()):
         """Record filter parameters to database and apply it."""
-        update = self.filter_query()
-        self.db.update('filter_operating_mode', field='value',
-                       value=operating_mode, table='options', updfield='name')
-        self.db.update('filter', field='value', value=script, table='options',
-                       updfield='name')
-        self.db.update('filter_tags', field='value',
-                       value=','.join([str(x) for x in tags]), table='options',
-                       updfield='name')
-        self.db.update('filter_dates', field='value', value=','.join(dates),
-                       table='options', updfield='name')
-        if update != self.filter_query():
+        update = self.db.load_filter()
+        self.db.save_filter(operating_mode, dates, tags)
+        if update != self.db.load_filter():
             self.update_table()
 
+    def destroy(self):
+        if self.search_job:
+            self.after_cancel(self.search_job)
+        self.table_frame.close_source()
+        self.list_db.close()
+        super().destroy()
+
 
 class TaskEditWindow(Window):
     """Task properties window."""
@@ -1067,20 +1321,25 @@ class TaskEditWindow(Window):
     def update_task(self):
         """Update task in database."""
         task_data = self.description_area.get().rstrip()
-        self.db.update_task(self.task["id"], field='description',
-                            value=task_data)
         # Renew tags list for the task:
         existing_tags = [x[0] for x in
                          self.db.find_by_clause('tasks_tags', 'task_id',
                                                 self.task["id"], 'tag_id')]
+        added_tags = []
+        removed_tags = []
         for item in self.tags.states_list:
             if item[1][0].get() == 1:
                 if item[0] not in existing_tags:
-                    self.db.insert('tasks_tags', ('task_id', 'tag_id'),
-                                   (self.task["id"], item[0]))
-            else:
-                self.db.delete(table="tasks_tags", task_id=self.task["id"],
-                               tag_id=item[0])
+                    added_tags.append((self.task["id"], item[0]))
+            elif item[0] in existing_tags:
+                removed_tags.append((self.task["id"], item[0]))
+        with self.db.transaction():
+            self.db.update_task(self.task["id"], field='description',
+                                value=task_data)
+            self.db.insert_many('tasks_tags', ('task_id', 'tag_id'),
+                                added_tags)
+            self.db.delete_many('tasks_tags', ('task_id', 'tag_id'),
+                                removed_tags)
         # Reporting to parent window that task has been changed:
         if self.change_var:
             self.change_var.set(1)
@@ -1163,11 +1422,14 @@ class TagsEditWindow(Window):
         self.db.insert('tags', ('id', 'name'), (None, tagname))
 
     def del_record(self, dellist):
-        self.db.delete(id=dellist, table='tags')
-        self.db.delete(tag_id=dellist, table='tasks_tags')
+        with self.db.transaction():
+            self.db.delete(id=dellist, table='tags')
+            self.db.delete(tag_id=dellist, table='tasks_tags')
 
 
 class TimestampsTable(Table):
+    """Timestamps table. Rows are added page by page. Treeview item ids
+    are rowids of timestamps in the database."""
 
     def __init__(self, columns, parent=None, **options):
         super().__init__(columns, parent=parent, **options)
@@ -1175,35 +1437,48 @@ class TimestampsTable(Table):
         self.table.column('since', width=150, anchor='w')
         self.table.column('comment', width=450, anchor='w')
         self.table.column('real', width=250, anchor='w')
+        # Function which reloads rows in order of (field, reverse):
+        self.sort_command = None
 
     def sort_table_contents(self, col, reverse):
-        """Sorting by click on column header."""
+        """Sorting by click on column header. Rows are loaded page
+        by page, so they are sorted by database through sort_command."""
         if col == "stamp":
-            shortlist = self._sort(0, reverse)
+            order = ("timestamp", reverse)
         elif col == "real":
-            shortlist = self._sort(1, reverse)
+            order = ("datetime", reverse)
         elif col == "since":
-            shortlist = self._sort(2, reverse)
+            # Time spent since timestamp decreases with timestamp:
+            order = ("timestamp", not reverse)
         else:
             return
-        shortlist.sort(key=lambda x: x[0], reverse=reverse)
-        for index, value in enumerate(shortlist):
-            self.table.move(value[1], '', index)
+        if self.sort_command:
+            self.sort_command(*order)
         self.table.heading(
             col, command=lambda: self.sort_table_contents(col, not reverse))
 
-    def update_timestamps_list(self, data):
-        """Refill table contents."""
-        self.update_data(data)
-        for t in data:
-            t[0] = core.time_format(int(t[0]))
-            t[1] = core.table_date_format(t[1])
-            t[2] = core.time_format(int(t[2]))
-        self.insert_rows(data)
+    def clear(self):
+        """Removes all rows."""
+        self.table.delete(*self.table.get_children())
+
+    def append_timestamps(self, rows, task_time):
+        """Adds rows (rowid, timestamp, event_type, datetime, comment)
+        to the end of the table."""
+        data = [(row[1], row[3], task_time - row[1], row[4]) for row in rows]
+        columns = zip(core.time_format_column([int(t[0]) for t in data]),
+                      core.table_date_format_column([t[1] for t in data]),
+                      core.time_format_column([int(t[2]) for t in data]))
+        start = len(self.table.get_children())
+        for n, (row, raw, values) in enumerate(zip(rows, data, columns)):
+            self.table.insert('', 'end', iid=row[0],
+                              text="#%d" % (start + n + 1),
+                              values=(*values, raw[3]))
 
 
 class TimestampsWindow(Window):
     """Window with timestamps for selected task."""
+    # Name of events filter value which shows every timestamp:
+    all_events = "All events"
 
     def __init__(self, taskid, task_time, parent=None, **options):
         super().__init__(master=parent, **options)
@@ -1217,8 +1492,17 @@ class TimestampsWindow(Window):
                                     "comment": "Comment"})
         self.stamps_frame = TimestampsTable(column_names, parent=self)
         self.stamps_frame.grid(row=0, column=0, columnspan=2, sticky='news')
+        self.stamps_frame.sort_command = self.sort
+        # Next page is loaded when table is scrolled to the end:
+        self.stamps_frame.table.config(yscrollcommand=self.scrolled)
+        # Field and direction of rows order:
+        self.order = ("datetime", False)
+        # Key of the last loaded row, (field value, rowid):
+        self.last_key = None
+        self.loaded = self.total = 0
+        self.loading = False
         elements.TaskButton(self, text="Select all",
-                            command=self.stamps_frame.select_all).grid(
+                            command=self.select_all).grid(
                                                           row=1, column=0,
                                                           pady=5, padx=5,
                                                           sticky='w')
@@ -1227,7 +1511,14 @@ class TimestampsWindow(Window):
                                                          row=1, column=1,
                                                          pady=5, padx=5,
                                                          sticky='e')
-        tk.Frame(self, height=40).grid(row=2)
+        self.events_var = tk.StringVar(value=self.all_events)
+        events_box = ttk.Combobox(
+            self, textvariable=self.events_var, state='readonly',
+            values=[self.all_events, *(x.title() for x in core.LOG_EVENTS)])
+        events_box.grid(row=2, column=0, pady=10, padx=5, sticky='w')
+        events_box.bind("<<ComboboxSelected>>", lambda e: self.update_table())
+        self.count_label = tk.Label(self)
+        self.count_label.grid(row=2, column=1, padx=5, sticky='e')
         self.update_table()
         elements.TaskButton(
             self, text="Delete...", command=self.delete).grid(
@@ -1239,37 +1530,75 @@ class TimestampsWindow(Window):
         self.minsize(width=710, height=500)
         self.prepare()
 
+    def events(self):
+        """Returns list of selected events types, None for all events."""
+        name = self.events_var.get()
+        if name == self.all_events:
+            return None
+        return [core.LOG_EVENTS[name.upper()]]
+
     def update_table(self):
-        db_contents = self.db.find_by_clause("timestamps", "task_id",
-                                             self.task_id, "*")
-        tlist = [{"stamp": timestamp[0], "datetime": timestamp[3],
-                  "comment": timestamp[4],
-                  "spent_since": self.task_time - timestamp[0]}
-                 for timestamp in db_contents]
-        self.stamps_frame.update_timestamps_list([[f["stamp"], f["datetime"],
-                                                   f["spent_since"],
-                                                   f["comment"]] for f in tlist])
-        self.sdict = {}
-        for n, task_id in enumerate(self.stamps_frame.table.get_children()):
-            self.sdict[task_id] = tlist[n]
+        """Reloads timestamps starting from the first page."""
+        self.last_key = None
+        self.loaded = 0
+        self.total = self.db.count_timestamps(self.task_id, self.events())
+        self.stamps_frame.clear()
+        self.load_page()
+
+    def load_page(self):
+        """Adds next page of timestamps to the table."""
+        self.loading = False
+        if self.loaded >= self.total:
+            return
+        rows = self.db.timestamps_page(self.task_id, self.last_key,
+                                       self.events(), order=self.order[0],
+                                       reverse=self.order[1])
+        if rows:
+            self.last_key = self.db.timestamps_key(rows[-1], self.order[0])
+            self.stamps_frame.append_timestamps(rows, self.task_time)
+            self.loaded += len(rows)
+        else:
+            # Timestamps have been deleted by somebody else:
+            self.total = self.loaded
+        self.update_count()
+
+    def sort(self, field, reverse):
+        """Reloads timestamps in given order from the first page."""
+        self.order = (field, reverse)
+        self.update_table()
+
+    def update_count(self):
+        self.count_label.config(text="Shown {0} of {1}".format(self.loaded,
+                                                               self.total))
+
+    def scrolled(self, first, last):
+        """Scrollbar callback which loads more rows at the end."""
+        self.stamps_frame.scroller.set(first, last)
+        if float(last) >= 1.0 and self.loaded < self.total \
+                and not self.loading:
+            self.loading = True
+            self.after_idle(self.load_page)
+
+    def select_all(self):
+        """Selects all timestamps, loading ones which are not shown yet."""
+        while self.loaded < self.total:
+            self.load_page()
+        self.stamps_frame.select_all()
 
     def delete(self):
-        """Deletes selected timestamps."""
+        """Deletes selected timestamps by one statement."""
         ids = self.stamps_frame.table.selection()
-        dates = [self.sdict[x]["datetime"] for x in ids]
         if ids:
             answer = askyesno("Warning",
                               "Are you sure you want to delete "
                               "selected timestamps?",
                               parent=self)
             if answer:
-                for x in dates:
-                    self.db.delete(table="timestamps", datetime=x,
-                                   task_id=self.task_id)
-
-                self.stamps_frame.table.delete(*ids)
-                for item in ids:
-                    self.sdict.pop(item)
+                self.db.delete_timestamps(ids)
+                self.stamps_frame.delete_items(ids)
+                self.loaded -= len(ids)
+                self.total -= len(ids)
+                self.update_count()
 
 
 class HelpWindow(Window):
@@ -1324,6 +1653,7 @@ class Tagslist(elements.ScrolledCanvas):
 
 class FilterWindow(Window):
     """Filters window."""
+    db_readonly = True
 
     def __init__(self, parent=None, variable=None, **options):
         super().__init__(master=parent, **options)
@@ -1333,13 +1663,11 @@ class FilterWindow(Window):
         self.changed_var = variable
         # Operating mode of the filter: "AND", "OR".
         self.operating_mode_var = tk.StringVar()
-        # Lists of stored filter parameters:
-        stored_dates = self.db.find_by_clause(
-            'options', 'name', 'filter_dates', 'value')[0][0].split(',')
-        stored_tags = str(self.db.find_by_clause(
-            'options', 'name', 'filter_tags', 'value')[0][0]).split(',')
-        if stored_tags[0]:  # stored_tags[0] is string.
-            stored_tags = list(map(int, stored_tags))
+        # Stored filter parameters:
+        stored_filter = self.db.load_filter() or {
+            "mode": "AND", "dates": [], "tags": []}
+        stored_dates = stored_filter["dates"]
+        stored_tags = stored_filter["tags"]
         # Dates list:
         dates = self.db.simple_dateslist()
         # Tags list:
@@ -1380,10 +1708,7 @@ class FilterWindow(Window):
                                    variable=self.operating_mode_var,
                                    value="OR").grid(row=0, column=1,
                                                     sticky='w')
-        self.operating_mode_var.set(
-            self.db.find_by_clause(table="options", field="name",
-                                   value="filter_operating_mode",
-                                   searchfield="value")[0][0])
+        self.operating_mode_var.set(stored_filter["mode"])
         tk.Frame(self, height=20).grid(row=8, column=0, columnspan=2,
                                        sticky='news')
         elements.TaskButton(self, text="Cancel", command=self.destroy).grid(
@@ -1422,20 +1747,15 @@ class FilterWindow(Window):
                     date[1][0].set(1)
 
     def apply_filter(self):
-        """Create database script based on checkboxes values."""
+        """Collect filter parameters based on checkboxes values."""
         dates = list(reversed(
             [x[0] for x in self.dates_list.states_list if x[1][0].get() == 1]))
         tags = list(reversed(
             [x[0] for x in self.tags_list.states_list if x[1][0].get() == 1]))
         if not dates and not tags:
-            script = None
             self.operating_mode_var.set("AND")
-        else:
-            script = core.prepare_filter_query(dates, tags,
-                                               self.operating_mode_var.get())
         GLOBAL_OPTIONS["filter_dict"] = {
             'operating_mode': self.operating_mode_var.get(),
-            'script': script,
             'tags': tags,
             'dates': dates
         }
@@ -1453,6 +1773,8 @@ class CalendarWindow(Window):
         self.correct_data = correct_data
         self.start_var = startvar
         self.end_var = endvar
+        # Calendar is imported only when it is needed:
+        import sel_cal
         self.start_date_entry = sel_cal.Datepicker(
             self, datevar=self.start_var,
             current_month=core.str_to_date(startdate).month,
@@ -1525,11 +1847,41 @@ class MainFrame(elements.ScrolledCanvas):
 
     def __init__(self, parent):
         super().__init__(parent=parent, bd=2)
+        # Used to save state of all frames in one transaction:
+        self.db = core.Db()
         self.frames_count = 0
         self.rows_counter = 0
         self.frames = []
+        # ID of scheduled tick, created by after():
+        self.ticker = None
+        self.last_save = time.monotonic()
         self.fill()
 
+    def start_ticker(self):
+        """Start ticking if it is not started yet."""
+        if self.ticker is None:
+            self.last_save = time.monotonic()
+            self.ticker = self.after(GLOBAL_OPTIONS["TIMER_INTERVAL"],
+                                     self.tick)
+
+    def tick(self):
+        """Renewal of counters of all running frames.
+        Every n seconds their values are saved in database.
+        Stops when there are no running frames left."""
+        running = [frame for frame in self.frames if frame.running]
+        if not running:
+            self.ticker = None
+            return
+        now = time.monotonic()
+        save = (now - self.last_save) * 1000 >= GLOBAL_OPTIONS["SAVE_INTERVAL"]
+        for frame in running:
+            frame.timer_update(now)
+            if save:
+                frame.task_update()
+        if save:
+            self.last_save = now
+        self.ticker = self.after(GLOBAL_OPTIONS["TIMER_INTERVAL"], self.tick)
+
     def clear(self):
         """Remove all task frames except with opened tasks."""
         for w in self.content_frame.winfo_children():
@@ -1546,9 +1898,10 @@ class MainFrame(elements.ScrolledCanvas):
         answer = askyesno("Really clear?",
                           "Are you sure you want to close all task frames?")
         if answer:
-            for w in self.content_frame.winfo_children():
-                if hasattr(w, 'task'):
-                    w.clear()
+            with self.db.transaction():
+                for w in self.content_frame.winfo_children():
+                    if hasattr(w, 'task'):
+                        w.clear()
             self.fill()
 
     def frames_timer_indicator_update(self):
@@ -1568,7 +1921,9 @@ class MainFrame(elements.ScrolledCanvas):
                           sticky='ew')
                 if GLOBAL_OPTIONS["preserved_tasks_list"]:
                     task_id = GLOBAL_OPTIONS["preserved_tasks_list"].pop(0)
-                    task.get_restored_task_name(task_id)
+                    task.get_restored_task_name(
+                        task_id, GLOBAL_OPTIONS["preserved_tasks"].pop(
+                            task_id, None))
                 self.frames.append(task)
                 self.rows_counter += 1
             self.frames_count += len(row_count)
@@ -1594,18 +1949,24 @@ class MainFrame(elements.ScrolledCanvas):
                     widget.small_interface()
 
     def pause_all(self):
-        for frame in self.frames:
-            if frame.running:
-                frame.timer_stop(paused=True)
+        with self.db.transaction():
+            for frame in self.frames:
+                if frame.running:
+                    frame.timer_stop(paused=True)
 
     def resume_all(self):
-        for frame in self.frames:
-            if frame.paused:
+        paused = [frame for frame in self.frames if frame.paused]
+        # Data of all resumed tasks is loaded by one query
+        # and then taken from cache by every frame:
+        self.db.select_tasks(frame.task["id"] for frame in paused)
+        with self.db.transaction():
+            for frame in paused:
                 frame.timer_start(stop_all=False)
 
     def stop_all(self):
-        for frame in self.frames:
-            frame.timer_stop()
+        with self.db.transaction():
+            for frame in self.frames:
+                frame.timer_stop()
 
 
 class MainMenu(tk.Menu):
@@ -1623,7 +1984,7 @@ class MainMenu(tk.Menu):
         helpmenu = tk.Menu(self, tearoff=0)
         helpmenu.add_command(label="Help...",
                              command=lambda: helpwindow(parent=ROOT_WINDOW,
-                                                        text=core.HELP_TEXT))
+                                                        text=core.get_help()))
         helpmenu.add_command(label="About...", command=self.aboutwindow)
         elements.big_font(helpmenu, elements.FONTSIZE + 1)
         self.add_cascade(label="Help", menu=helpmenu)
@@ -1696,11 +2057,12 @@ class MainMenu(tk.Menu):
 
     def change_parameter(self, paramdict):
         """Change option in the database."""
-        for key, value in paramdict.items():
-            self.db.update(table='options', field='value', value=value,
-                           field_id=key, updfield='name')
-            GLOBAL_OPTIONS[key] = value
-        self.db.con.close()
+        with self.db.transaction():
+            for key, value in paramdict.items():
+                self.db.update(table='options', field='value', value=value,
+                               field_id=key, updfield='name')
+                GLOBAL_OPTIONS[key] = value
+        self.db.close()
 
     def aboutwindow(self):
         showinfo("About %s" % core.TITLE,
@@ -1798,23 +2160,29 @@ class Options(Window):
 
 class ExportWindow(Window):
     """Export dialogue window."""
+    db_readonly = True
+    # Interval of export progress check, ms:
+    poll_interval = 100
 
-    def __init__(self, parent, data, **options):
+    def __init__(self, parent, task_ids, **options):
         super().__init__(master=parent, **options)
         self.title("Export parameters")
-        self.task_ids = [x["id"] for x in data.values()]
-        self.operating_mode_var = tk.IntVar(self)
-        elements.SimpleLabel(self, text="Export mode", fontsize=elements.FONTSIZE + 1).grid(
+        self.task_ids = task_ids
+        # Running export and its scheduled progress check:
+        self.job = None
+        self.poll_job = None
+        self.format_var = tk.StringVar(self, value=next(iter(export.WRITERS)))
+        elements.SimpleLabel(self, text="Export format", fontsize=elements.FONTSIZE + 1).grid(
             row=0, column=0, columnspan=2, sticky='ns', pady=5)
-        elements.SimpleRadiobutton(self, text="Task-based",
-                                   variable=self.operating_mode_var,
-                                   value=0).grid(row=1, column=0)
-        elements.SimpleRadiobutton(self, text="Date-based",
-                                   variable=self.operating_mode_var,
-                                   value=1).grid(row=1, column=1)
-        tk.Frame(self, height=15).grid(row=2, column=0)
-        elements.TaskButton(self, text="Export", command=self.get_data).grid(
-            row=3, column=0, padx=5, pady=5, sticky='ws')
+        ttk.Combobox(self, textvariable=self.format_var, state='readonly',
+                     values=list(export.WRITERS), width=25).grid(
+            row=1, column=0, columnspan=2, padx=5)
+        self.progress_var = tk.StringVar(self)
+        elements.SimpleLabel(self, textvariable=self.progress_var).grid(
+            row=2, column=0, columnspan=2, pady=5)
+        self.export_button = elements.TaskButton(self, text="Export",
+                                                 command=self.get_data)
+        self.export_button.grid(row=3, column=0, padx=5, pady=5, sticky='ws')
         elements.TaskButton(self, text="Cancel", command=self.destroy).grid(
             row=3, column=1, padx=5, pady=5, sticky='es')
         self.minsize(height=150, width=250)
@@ -1824,31 +2192,55 @@ class ExportWindow(Window):
         self.prepare()
 
     def get_data(self):
-        """Take from the database information to be exported and prepare it.
-        All items should be strings."""
-        if self.operating_mode_var.get() == 0:
-            prepared_data = self.db.tasks_to_export(self.task_ids)
-        else:
-            prepared_data = self.db.dates_to_export(self.task_ids)
-        self.export('\n'.join(prepared_data))
-
-    def export(self, data):
-        while True:
-            filename = asksaveasfilename(parent=self, defaultextension=".csv",
-                                         filetypes=[("All files", "*.*"), (
-                                         "Comma-separated texts", "*.csv")])
-            if filename:
-                try:
-                    core.write_to_disk(filename, data)
-                except PermissionError:
-                    showinfo("Unable to save file",
-                             "No permission to save file here!"
-                             "Please select another location.")
-                else:
-                    break
+        """Export tasks using selected format. Export runs
+        in background, so timers are not interrupted."""
+        if self.job:
+            return
+        writer = export.WRITERS[self.format_var.get()]
+        filename = asksaveasfilename(parent=self,
+                                     defaultextension=writer.extension,
+                                     filetypes=[writer.filetype,
+                                                ("All files", "*.*")])
+        if filename:
+            self.export_button.config(state='disabled')
+            self.job = export.ExportJob(self.format_var.get(), self.task_ids,
+                                        filename)
+            self.job.start()
+            self.check_progress()
+
+    def check_progress(self):
+        """Shows export progress and reacts on export end."""
+        self.poll_job = None
+        state = None
+        while not self.job.queue.empty():
+            state, done, total, error = self.job.queue.get()
+            self.progress_var.set("Exported {0} of {1}".format(
+                done, total))
+        if state == "progress" or state is None:
+            self.poll_job = self.after(self.poll_interval, self.check_progress)
+        elif state == "error":
+            self.job = None
+            self.export_button.config(state='normal')
+            self.progress_var.set('')
+            if isinstance(error, PermissionError):
+                showinfo("Unable to save file",
+                         "No permission to save file here!"
+                         "Please select another location.")
             else:
-                break
-        self.destroy()
+                showinfo("Unable to save file", str(error))
+        else:
+            self.job = None
+            self.destroy()
+
+    def destroy(self):
+        if self.poll_job:
+            self.after_cancel(self.poll_job)
+            self.poll_job = None
+        if self.job:
+            # Job removes its partial file and ends in background:
+            self.job.cancel()
+            self.job = None
+        super().destroy()
 
 
 class MainWindow(tk.Tk):
@@ -1880,6 +2272,18 @@ class MainWindow(tk.Tk):
             self.wm_attributes("-topmost", 1)
         self.bind("<Key>", self.hotkeys)
 
+    def report_callback_exception(self, exc, value, traceback):
+        """Database errors raised by event handlers are shown to user.
+        For example, statements inside of transaction are not repeated
+        while database is locked by another process, so action fails."""
+        if isinstance(value, core.DbErrors):
+            logging.getLogger("tracker").warning("Database error: %s", value)
+            showwarning("Database error",
+                        "Action is not completed because of database "
+                        "error:\n%s" % value)
+        else:
+            super().report_callback_exception(exc, value, traceback)
+
     def hotkeys(self, event):
         """Execute corresponding actions for hotkeys."""
         if event.keysym in ('Cyrillic_yeru', 'Cyrillic_YERU', 's', 'S'):
@@ -1964,8 +2368,10 @@ class MainWindow(tk.Tk):
             else:
                 tasks = ''
             db.update_preserved_tasks(tasks)
-            db.con.close()
+            db.close()
             super().destroy()
+            core.close_connections()
+            INSTANCE_LOCK.release()
 
 
 def get_all_widget_children(widget, children_list):
@@ -2015,10 +2421,10 @@ def paste_from_clipboard():
             "selected_widget"].clipboard_get())
 
 
-def get_options():
-    """Get program preferences from database."""
-    db = core.Db()
-    return {x[0]: x[1] for x in db.find_all(table='options')}
+def log_startup_time(timer):
+    """Logs startup phases durations when main window is drawn."""
+    timer.phase("main window")
+    logging.getLogger("tracker").info("Startup: %s", timer.report())
 
 
 if __name__ == "__main__":
@@ -2028,23 +2434,40 @@ if __name__ == "__main__":
     TIMER_INTERVAL = 250
     # Interval between saving time to database:
     SAVE_INTERVAL = 10000  # ms
-    # Check if tasks database actually exists:
-    core.check_database()
-    # Create options dictionary:
-    GLOBAL_OPTIONS = get_options()
-    # Global tasks ids set. Used for preserve duplicates:
-    if GLOBAL_OPTIONS["tasks"]:
-        GLOBAL_OPTIONS["tasks"] = dict.fromkeys(
-            map(int, str(GLOBAL_OPTIONS["tasks"]).split(",")), False)
-    else:
-        GLOBAL_OPTIONS["tasks"] = dict()
+    # Startup time is logged when TRACKER_LOG=INFO is set:
+    logging.basicConfig(level=os.environ.get("TRACKER_LOG", "WARNING"))
+    STARTUP_TIMER = core.StartupTimer(START_TIME)
+    STARTUP_TIMER.phase("imports")
+    # Check if tasks database actually exists, create options dictionary
+    # and load preserved tasks:
+    GLOBAL_OPTIONS, PRESERVED_TASKS = core.bootstrap(STARTUP_TIMER)
+    # Global tasks ids set. Used for preserve duplicates.
+    # Tasks which have been deleted are not restored:
+    preserved_ids = str(GLOBAL_OPTIONS["tasks"]).split(",") \
+        if GLOBAL_OPTIONS["tasks"] else []
+    GLOBAL_OPTIONS["tasks"] = dict.fromkeys(
+        (x for x in map(int, preserved_ids) if x in PRESERVED_TASKS), False)
     # List of preserved tasks which are not open:
     GLOBAL_OPTIONS["preserved_tasks_list"] = list(GLOBAL_OPTIONS["tasks"])
+    GLOBAL_OPTIONS["preserved_tasks"] = PRESERVED_TASKS
     # Widget which is currently connected to context menu:
     GLOBAL_OPTIONS["selected_widget"] = None
     GLOBAL_OPTIONS.update({"MAX_TASKS": MAX_TASKS,
                            "TIMER_INTERVAL": TIMER_INTERVAL,
                            "SAVE_INTERVAL": SAVE_INTERVAL})
+    # Other running instance is detected by lock next to database file:
+    INSTANCE_LOCK = core.InstanceLock()
+    single_instance = INSTANCE_LOCK.acquire()
+    if single_instance:
+        # Timers of windows which have not been closed properly:
+        core.Db().clear_window_timers()
     # Main window:
     ROOT_WINDOW = MainWindow()
+    if not single_instance:
+        ROOT_WINDOW.after_idle(
+            showwarning, "Another instance is running",
+            "Database is already used by another running tracker. "
+            "Time of all timers is saved, but time spent on the same task "
+            "in other instance is not shown until the task is restarted.")
+    ROOT_WINDOW.after_idle(log_startup_time, STARTUP_TIMER)
     ROOT_WINDOW.mainloop()
\ No newline at end of file
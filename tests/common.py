@@ -0,0 +1,38 @@
+"""Helpers shared by tests: modules of src are imported as the
+programs import them, and every test gets a new database file."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "src"))
+
+import core  # noqa: E402
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Creates database in a temporary directory for every test."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.table_file = core.TABLE_FILE
+        core.TABLE_FILE = os.path.join(self.directory.name, "tasks.db")
+        core.TASK_CACHE.invalidate()
+        core.RESULT_CACHE.clear()
+        core.check_database()
+        self.db = core.Db()
+
+    def tearDown(self):
+        core.close_connections()
+        core.TABLE_FILE = self.table_file
+        self.directory.cleanup()
+
+    def add_task(self, name, *activity):
+        """Creates task with activity given as (date, seconds) pairs.
+        Returns task id."""
+        task_id = self.db.insert_task(name)
+        for date, spent in activity:
+            self.db.add_task_activity(task_id, spent, date)
+        return task_id
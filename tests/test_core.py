@@ -0,0 +1,29 @@
+import datetime
+
+from common import DatabaseTestCase
+
+
+class CompactIntervalsTest(DatabaseTestCase):
+
+    def activity(self, task_id):
+        self.db.exec_script("SELECT date, spent_time FROM activity "
+                            "WHERE task_id=? AND date LIKE '2024-%' "
+                            "ORDER BY date", task_id)
+        return self.db.cur.fetchall()
+
+    def test_split_by_days(self):
+        task_id = self.add_task("Task")
+        self.db.add_intervals([(task_id, datetime.datetime(2024, 1, 1, 23),
+                                datetime.datetime(2024, 1, 3, 0, 30))])
+        self.assertEqual(self.activity(task_id), [
+            ("2024-01-01", 3600), ("2024-01-02", 86400),
+            ("2024-01-03", 1800)])
+
+    def test_stop_at_midnight(self):
+        task_id = self.add_task("Task")
+        self.db.add_intervals([
+            (task_id, datetime.datetime(2024, 1, 1, 23),
+             datetime.datetime(2024, 1, 2)),
+            (task_id, datetime.datetime(2024, 1, 5, 10),
+             datetime.datetime(2024, 1, 5, 10))])
+        self.assertEqual(self.activity(task_id), [("2024-01-01", 3600)])
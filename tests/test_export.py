@@ -0,0 +1,57 @@
+import datetime
+import json
+import os
+
+from common import DatabaseTestCase, core
+
+import export
+
+
+class JsonLinesTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.task_id = self.add_task("Task", ("2024-01-02", 10))
+        # Intervals are stored with milliseconds, so their time
+        # in activity is fractional:
+        start = datetime.datetime(2024, 1, 1, 10, 0, 0)
+        self.db.add_intervals([
+            (self.task_id, start,
+             start + datetime.timedelta(seconds=1, milliseconds=642))])
+
+    def test_spent_time_is_integer(self):
+        records = [json.loads(x)
+                   for x in self.db.activity_to_export([self.task_id])]
+        self.assertEqual(
+            [(x["date"], x["spent_time"]) for x in records
+             if x["spent_time"]],
+            [("2024-01-01", 2), ("2024-01-02", 10)])
+        for record in records:
+            self.assertIsInstance(record["spent_time"], int)
+
+    def test_writer_output(self):
+        filename = os.path.join(self.directory.name, "export.jsonl")
+        writer = export.JsonLinesWriter()
+        writer.write(filename, writer.rows(self.db, [self.task_id]))
+        with open(filename, encoding="UTF-8") as lines:
+            records = [json.loads(x) for x in lines]
+        self.assertTrue(records)
+        self.assertEqual(records[0]["task"], "Task")
+        self.assertEqual(records[0]["tags"], ["default"])
+        self.assertNotIn(".", "".join(
+            str(x["spent_time"]) for x in records))
+
+
+class CsvTest(DatabaseTestCase):
+
+    def test_time_is_truncated(self):
+        # Time in CSV is shown as in tasks table, without fractions:
+        task_id = self.add_task("Task", ("2024-01-02", 10))
+        start = datetime.datetime(2024, 1, 1, 10, 0, 0)
+        self.db.add_intervals([(task_id, start, start + datetime.timedelta(
+            seconds=59, milliseconds=642))])
+        rows = list(self.db.tasks_to_export([task_id]))
+        self.assertEqual(rows[1], ("Task", "", "2024-01-01", "00:00:59",
+                                   "00:01:09"))
+        rows = list(self.db.dates_to_export([task_id]))
+        self.assertEqual(rows[1][3:], ("00:00:59", "00:00:59"))
@@ -0,0 +1,134 @@
+import asyncio
+import datetime
+import http.client
+import json
+import threading
+
+from common import DatabaseTestCase, core
+
+import server
+
+
+class ApiServerTest(DatabaseTestCase):
+    """Server listens on a free port, its event loop runs in a separate
+    thread, so requests are sent by a usual blocking client."""
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.add_task("First", ("2024-01-01", 100))
+        self.second = self.add_task("Second", ("2024-01-02", 200))
+        self.db.update_task(self.second, field="description", value="Text")
+        self.db.exec_script("INSERT INTO tags VALUES (2, 'Tag')")
+        self.db.exec_script("INSERT INTO tasks_tags VALUES (?, 2)",
+                            self.second)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.server = server.ApiServer(2)
+        listener = self.run_async(self.server.start(port=0))
+        self.port = listener.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        self.run_async(self.server.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        super().tearDown()
+
+    def run_async(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def request(self, path, method="GET"):
+        """Returns status, content type and body of response."""
+        client = http.client.HTTPConnection("127.0.0.1", self.port,
+                                            timeout=10)
+        try:
+            client.request(method, path)
+            response = client.getresponse()
+            return (response.status, response.getheader("Content-Type"),
+                    response.read().decode("UTF-8"))
+        finally:
+            client.close()
+
+    def get(self, path):
+        status, content_type, body = self.request(path)
+        self.assertEqual(content_type, "application/json")
+        return status, json.loads(body)
+
+    def test_running(self):
+        self.db.start_timer(self.first)
+        self.db.start_window_timer(self.second)
+        status, result = self.get("/running")
+        self.assertEqual(status, 200)
+        timers = {x["id"]: x for x in result}
+        self.assertEqual(timers[self.first]["source"], "cli")
+        self.assertEqual(timers[self.second]["source"], "window")
+        self.assertGreaterEqual(timers[self.first]["spent_total"], 100)
+        self.assertEqual(timers[self.second]["spent_total"], 200)
+        self.assertEqual(timers[self.second]["description"], "Text")
+        self.db.stop_window_timer(self.second)
+        status, result = self.get("/running")
+        self.assertEqual([x["id"] for x in result], [self.first])
+
+    def test_running_in_several_windows(self):
+        self.db.start_window_timer(self.first)
+        # Record of another tracker process:
+        self.db.exec_script("INSERT INTO running_tasks VALUES (?, ?, ?)",
+                            self.first, core.date_format(
+                                datetime.datetime.now(),
+                                core.DATE_STORAGE_TEMPLATE), 1)
+        self.db.stop_window_timer(self.first)
+        status, result = self.get("/running")
+        self.assertEqual([(x["id"], x["source"]) for x in result],
+                         [(self.first, "window")])
+
+    def test_tasks_by_ids(self):
+        status, result = self.get("/tasks?ids=%d,%d" % (self.first,
+                                                        self.second))
+        self.assertEqual(status, 200)
+        tasks = {x["id"]: x for x in result}
+        self.assertEqual(tasks[self.second]["name"], "Second")
+        self.assertEqual(tasks[self.second]["description"], "Text")
+        self.assertEqual(tasks[self.second]["spent_total"], 200)
+
+    def test_tasks_list(self):
+        status, result = self.get("/tasks")
+        self.assertEqual(status, 200)
+        self.assertEqual([x["name"] for x in result], ["First", "Second"])
+        status, by_ids = self.get("/tasks?ids=%d" % self.second)
+        # Both forms of response use the same names of fields:
+        self.assertLessEqual(result[1].keys(), by_ids[0].keys())
+        self.assertEqual(result[1]["description"], "Text")
+        status, result = self.get("/tasks?mode=AND&tags=2")
+        self.assertEqual([x["id"] for x in result], [self.second])
+        status, result = self.get("/tasks?mode=OR&dates=2024-01-01&tags=2")
+        self.assertEqual(len(result), 2)
+        status, result = self.get("/tasks?limit=1&offset=1")
+        self.assertEqual([x["id"] for x in result], [self.second])
+
+    def test_timestamps(self):
+        self.db.add_timestamp(self.first, core.LOG_EVENTS["CUSTOM"], "Note",
+                              50)
+        status, result = self.get("/timestamps?task=%d" % self.first)
+        self.assertEqual(status, 200)
+        self.assertEqual([(x["event"], x["comment"], x["timestamp"])
+                          for x in result], [("CUSTOM", "Note", 50)])
+
+    def test_export(self):
+        status, content_type, body = self.request(
+            "/export?format=JSON%%20Lines&ids=%d" % self.second)
+        self.assertEqual(status, 200)
+        self.assertTrue(content_type.startswith("application/x-ndjson"))
+        records = [json.loads(x) for x in body.splitlines()]
+        self.assertIn(("2024-01-02", 200), [(x["date"], x["spent_time"])
+                                            for x in records])
+        status, content_type, body = self.request(
+            "/export?format=SQLite%20database&ids=1")
+        self.assertEqual(status, 400)
+
+    def test_errors(self):
+        self.assertEqual(self.get("/unknown")[0], 404)
+        self.assertEqual(self.get("/timestamps")[0], 400)
+        self.assertEqual(self.get("/tasks?ids=x")[0], 400)
+        self.assertEqual(self.get("/tasks?mode=XOR")[0], 400)
+        self.assertEqual(self.request("/tasks", "POST")[0], 405)